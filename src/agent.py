@@ -1,12 +1,19 @@
 # imports
+import asyncio
+import contextvars
 import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 from ibm_watsonx_ai import APIClient, Credentials
-from ibm_watsonx_ai.foundation_models.moderations import Guardian
 from IPython.display import Image, display
 from langchain_ibm import ChatWatsonx
 from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, START, END
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_community.utilities.sql_database import SQLDatabase
 from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
@@ -16,6 +23,8 @@ from langchain_core.messages import (
     HumanMessage,
     ToolMessage,
     AIMessage,
+    AIMessageChunk,
+    RemoveMessage,
     filter_messages,
 )
 from langchain_experimental.tools.python.tool import PythonREPLTool
@@ -23,8 +32,21 @@ from sqlalchemy import create_engine
 from typing_extensions import TypedDict
 from typing import Annotated
 import dal
-from prompt import generate_base_prompt, generate_eligibility_prompt
+import eligibility
+import metrics
+import moderation
+import streaming
+from token_budget import TokenBudget, split_turns
+from tool_outputs import ToolOutputStore
+from response_cache import ResponseCache
+from prompt import (
+    generate_base_prompt,
+    generate_eligibility_prompt,
+    generate_summary_prompt,
+    FORCE_FINAL_ANSWER,
+)
 from model import (
+    Loan,
     User,
     BaseAgentOutputSchema,
     EligibilityAgentOutputSchema,
@@ -32,7 +54,50 @@ from model import (
 from ibm_watsonx_ai import APIClient
 from langchain_ibm import ChatWatsonx
 from langchain.tools import BaseTool
-from langchain_core.messages.utils import trim_messages, count_tokens_approximately
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+
+
+# Tool calls requested in one LLM message run concurrently on this pool, which
+# is shared by every agent in the process so the total is bounded.
+TOOL_MAX_WORKERS = 8
+DEFAULT_TOOL_TIMEOUT_S = 30.0
+_tool_executor = ThreadPoolExecutor(
+    max_workers=TOOL_MAX_WORKERS, thread_name_prefix="agent-tool"
+)
+
+# Speculative mode runs the first base-advisor call alongside moderation.
+_speculation_executor = ThreadPoolExecutor(
+    max_workers=TOOL_MAX_WORKERS, thread_name_prefix="agent-speculation"
+)
+
+# Threads whose history exceeds this many tokens get their older turns folded
+# into a running summary after the response is returned.
+SUMMARIZE_AFTER_TOKENS = 6000
+_summary_executor = ThreadPoolExecutor(
+    max_workers=2, thread_name_prefix="agent-summary"
+)
+
+# Answers for the response cache are regenerated without the user profile,
+# after the turn, so nothing personal is shared between users.
+_shared_answer_executor = ThreadPoolExecutor(
+    max_workers=2, thread_name_prefix="agent-shared-answer"
+)
+
+# Serving-side prefix caches keep a prompt prefix for a few minutes; a base
+# advisor call this soon after the previous one is counted as a warm prefix.
+PREFIX_CACHE_WINDOW_S = 300.0
+
+# Turns that called only these tools do not depend on the user, so their
+# answers can be shared through the response cache.
+KNOWLEDGE_TOOLS = frozenset({"retrieve_loan_knowledge"})
+
+# User-facing JSON field streamed from each node's LLM output. The guardian
+# node only produces text when it runs the advisor speculatively.
+STREAMED_FIELDS = {
+    "guardian": "response",
+    "base_advisor": "response",
+    "eligibility_agent": "user_message",
+}
 
 
 class AgentState(TypedDict):
@@ -43,50 +108,119 @@ class AgentState(TypedDict):
     loan_to_apply: Annotated[
         int | None, "The loan id the user wants to apply for, if any"
     ]
+    summary: Annotated[str, "Running summary of turns folded out of messages"]
+    # usage of the turn in progress, checked against the TurnBudget
+    tool_rounds: Annotated[int, "Tool rounds run in the current turn"]
+    turn_tokens: Annotated[int, "LLM tokens (prompt + output) used in the current turn"]
+    turn_started_at: Annotated[float, "Start of the current turn (epoch seconds)"]
 
 
-def message_trimmer(
-    messages: list[AnyMessage], max_tokens: int = 1024
-) -> list[AnyMessage]:
-    """
-    Trim messages to fit within max_tokens limit.
+@dataclass(frozen=True)
+class TurnBudget:
+    """Per-turn limits on the advisor and eligibility tool loops.
+
+    Once one is reached, pending tool calls are skipped and the next LLM call
+    is made without tools and told to answer with what it has.
     """
-    return trim_messages(
-        messages,
-        strategy="last",
-        token_counter=count_tokens_approximately,
-        max_tokens=max_tokens,
-        start_on="human",
-        end_on=("human", "tool"),
-    )
 
+    max_tool_rounds: int = 6
+    max_tokens: int = 60_000
+    max_wall_s: float = 90.0
+
+
+def _discard_task(task: asyncio.Future):
+    """Cancel a speculative task whose result will not be used."""
+    task.cancel()
+    # retrieve its outcome so a failure is not reported as unhandled
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    metrics.increment("speculation.discarded")
+
+
+def run_user(config: RunnableConfig) -> User:
+    """The user a graph run is for, passed in the run config."""
+    return config["configurable"]["user"]
+
+
+class AgentRuntime:
+    """Compiled graph, tool-bound LLM and stores, shared by every session.
+
+    Built once per process. Nodes take the user from the run config (see
+    `ReActAgent.config`), so one compiled graph serves all users and creating
+    a session costs nothing.
+    """
 
-class ReActAgent:
     def __init__(
         self,
-        user: User,
         llm: ChatWatsonx,
         client: APIClient,
         tools: list[BaseTool],
         conn: sqlite3.Connection,
+        tool_timeouts: dict[str, float] | None = None,
+        speculative_moderation: bool = False,
+        pre_moderator: moderation.LocalModerator | None = None,
+        token_budget: TokenBudget | None = None,
+        summarize_after_tokens: int | None = SUMMARIZE_AFTER_TOKENS,
+        checkpointer: BaseCheckpointSaver | None = None,
+        tool_store: ToolOutputStore | None = None,
+        response_cache: ResponseCache | None = None,
+        turn_budget: TurnBudget | None = None,
     ):
-        memory = MemorySaver()
+        # e.g. checkpointer.SQLiteCheckpointer; in-memory if not given
+        memory = checkpointer or MemorySaver()
         graph = StateGraph(AgentState)
-        graph.add_node("guardian", self.guardian_moderation)
-        graph.add_node("base_advisor", self.call_base_advisor)
-        graph.add_node("eligibility_agent", self.call_eligibility_agent)
+        # every node has a sync and an async implementation, so the same graph
+        # serves both `invoke` and `ainvoke`/`astream`
+        if speculative_moderation:
+            graph.add_node(
+                "guardian",
+                RunnableLambda(
+                    self.speculative_moderation, afunc=self.aspeculative_moderation
+                ),
+            )
+        else:
+            graph.add_node(
+                "guardian",
+                RunnableLambda(
+                    self.guardian_moderation, afunc=self.aguardian_moderation
+                ),
+            )
+        graph.add_node(
+            "base_advisor",
+            RunnableLambda(self.call_base_advisor, afunc=self.acall_base_advisor),
+        )
+        graph.add_node(
+            "eligibility_agent",
+            RunnableLambda(
+                self.call_eligibility_agent, afunc=self.acall_eligibility_agent
+            ),
+        )
         # share same tools, but separate nodes for clarity
-        graph.add_node("base_agent_tools", self.call_tools)
-        graph.add_node("eligibility_agent_tools", self.call_tools)
+        tools_node = RunnableLambda(self.call_tools, afunc=self.acall_tools)
+        graph.add_node("base_agent_tools", tools_node)
+        graph.add_node("eligibility_agent_tools", tools_node)
         graph.add_node("block_message", self.block_message)
+        graph.add_node("compact_history", self.compact_history)
+        if response_cache is not None:
+            graph.add_node(
+                "response_cache",
+                RunnableLambda(self.cached_response, afunc=self.acached_response),
+            )
         graph.add_edge("base_advisor", END)
         graph.add_edge("eligibility_agent", END)
         graph.add_edge("block_message", END)
-        graph.add_conditional_edges(
-            "guardian",
-            lambda state: state["moderation_verdict"],
-            {"inappropriate": "block_message", "safe": "base_advisor"},
-        )
+        if speculative_moderation:
+            # the first advisor call already ran inside the guardian node
+            graph.add_conditional_edges(
+                "guardian",
+                self.route_after_speculation,
+                ["block_message", "base_agent_tools", "eligibility_agent", END],
+            )
+        else:
+            graph.add_conditional_edges(
+                "guardian",
+                lambda state: state["moderation_verdict"],
+                {"inappropriate": "block_message", "safe": "base_advisor"},
+            )
         graph.add_conditional_edges(
             "base_advisor",
             self.should_call_base_advisor_tools,
@@ -103,44 +237,217 @@ class ReActAgent:
         graph.add_conditional_edges(
             "base_advisor", self.should_apply_loan, ["eligibility_agent", END]
         )
-        graph.add_edge(START, "guardian")
+        graph.add_edge(START, "compact_history")
+        if response_cache is not None:
+            graph.add_edge("compact_history", "response_cache")
+            graph.add_conditional_edges(
+                "response_cache",
+                lambda state: (
+                    END if isinstance(state["messages"][-1], AIMessage) else "guardian"
+                ),
+                ["guardian", END],
+            )
+        else:
+            graph.add_edge("compact_history", "guardian")
         self.memory = memory
-        self.user = user
         self.graph = graph.compile(checkpointer=memory)
+        # full outputs of compacted tool results, re-fetchable by the agent
+        self.tool_store = tool_store or ToolOutputStore()
+        tools = [*tools, self.tool_store.as_tool()]
         self.tools = {t.name: t for t in tools}
         self.llm = llm.bind_tools(tools)
         self.client = client
+        self.detectors = moderation.GUARDIAN_DETECTORS
+        self.guardian = moderation.get_guardian(client, self.detectors)
         self.db_conn = conn
+        # per-tool timeout in seconds, falling back to DEFAULT_TOOL_TIMEOUT_S
+        self.tool_timeouts = tool_timeouts or {}
+        self.speculative = speculative_moderation
+        # local first tier; only uncertain messages reach the Guardian
+        self.pre_moderator = pre_moderator
+        # trims the checkpointed history sent to the base advisor
+        self.token_budget = token_budget or TokenBudget()
+        # shared answers to knowledge-only questions; None disables it
+        self.response_cache = response_cache
+        self.turn_budget = turn_budget or TurnBudget()
+        # background summarization; None disables it
+        self.summarize_after_tokens = summarize_after_tokens
+        # without tools, for summaries and forced final answers
+        self.plain_llm = llm
+        self._pending_summaries: dict[str, tuple[str, list[str]]] = {}
+        self._summarizing: set[str] = set()
+        self._summary_lock = threading.Lock()
+        self._last_base_advisor_call: float | None = None
 
-    def thread_id(self):
-        return str(self.user.user_id)
+    def _schedule_summary(self, thread_id: str):
+        if self.summarize_after_tokens is None:
+            return
+        with self._summary_lock:
+            if thread_id in self._summarizing or thread_id in self._pending_summaries:
+                return
+            self._summarizing.add(thread_id)
+        _summary_executor.submit(self._summarize, thread_id)
 
-    def invoke(self, user_input: str):
+    def _summarize(self, thread_id: str):
+        """Fold all but the last turns of a long thread into a new summary.
+
+        Runs in the background; the result is applied by `compact_history`
+        at the start of the thread's next turn, so it never races a running
+        turn and the LLM call stays off the critical path.
         """
-        Wrap a user input and call the compiled graph while supplying the thread_id
-        so MemorySaver stores/retrieves the conversation.
+        try:
+            config = {"configurable": {"thread_id": thread_id}}
+            values = self.graph.get_state(config).values  # type: ignore
+            messages = values.get("messages", [])
+            if self.token_budget.tokens(messages) < self.summarize_after_tokens:  # type: ignore
+                return
+            turns = split_turns(messages)
+            folded = [
+                m for turn in turns[: -self.token_budget.keep_last_turns] for m in turn
+            ]
+            if not folded:
+                return
+            started = time.perf_counter()
+            prompt = generate_summary_prompt(values.get("summary", ""), folded)
+            summary = str(self.plain_llm.invoke(prompt).content).strip()
+            metrics.histogram("summary_ms").observe(
+                (time.perf_counter() - started) * 1000
+            )
+            metrics.increment("summaries")
+            print(f"Summarized {len(folded)} messages for thread {thread_id}")
+            with self._summary_lock:
+                self._pending_summaries[thread_id] = (
+                    summary,
+                    [m.id for m in folded],  # type: ignore
+                )
+        except Exception as e:
+            print(f"Error summarizing thread {thread_id}: {e}")
+            metrics.increment("summary_errors")
+        finally:
+            with self._summary_lock:
+                self._summarizing.discard(thread_id)
+
+    def compact_history(self, state: AgentState, config: RunnableConfig):
+        """Shrink the history before a new turn.
+
+        Applies the summary prepared after the last turn, and replaces large
+        tool results of earlier turns with a digest whose full text moves to
+        the tool output store. Also starts the turn's budget.
         """
-        messages = [HumanMessage(content=user_input)]
-        # LangGraph expects state dict and a config; put thread id under configurable
-        config = {"configurable": {"thread_id": self.thread_id()}}
-        result = self.graph.invoke({"messages": messages}, config)  # type: ignore
-        return result
+        thread_id = config["configurable"]["thread_id"]
+        messages = state["messages"]
+        update: dict = {
+            "messages": [],
+            "tool_rounds": 0,
+            "turn_tokens": 0,
+            "turn_started_at": time.time(),
+        }
+        with self._summary_lock:
+            pending = self._pending_summaries.pop(thread_id, None)
+        folded_ids: set[str] = set()
+        if pending is not None:
+            summary, folded = pending
+            present = {m.id for m in messages}
+            folded_ids = {i for i in folded if i in present}
+            update["summary"] = summary
+            update["messages"] += [RemoveMessage(id=i) for i in folded_ids]
 
-    def clear_memory(self):
-        self.memory.delete_thread(self.thread_id())
+        # the new user message has been added; everything before it is done
+        current_turn = max(
+            (i for i, m in enumerate(messages) if isinstance(m, HumanMessage)),
+            default=len(messages),
+        )
+        for message in messages[:current_turn]:
+            if isinstance(message, ToolMessage) and message.id not in folded_ids:
+                compacted = self.tool_store.compact(thread_id, message)
+                if compacted is not None:
+                    update["messages"].append(compacted)
+        return update
 
-    def change_user(self, user: User):
-        self.user = user
-        self.clear_memory()
+    def clear_thread(self, thread_id: str):
+        self.memory.delete_thread(thread_id)
+        self.tool_store.delete_thread(thread_id)
+        with self._summary_lock:
+            self._pending_summaries.pop(thread_id, None)
+
+    def _budget_exhausted(self, state: AgentState) -> str | None:
+        """Name of the first turn budget that is used up, if any."""
+        budget = self.turn_budget
+        if state.get("tool_rounds", 0) >= budget.max_tool_rounds:
+            return "tool_rounds"
+        if state.get("turn_tokens", 0) >= budget.max_tokens:
+            return "tokens"
+        started = state.get("turn_started_at")
+        if started is not None and time.time() - started >= budget.max_wall_s:
+            return "wall_time"
+        return None
+
+    def _budgeted(self, state: AgentState, prompt: list[AnyMessage], node: str):
+        """The LLM and prompt for the next call of `node`; once the turn's
+        budget is used up, the LLM has no tools and must answer now."""
+        reason = self._budget_exhausted(state)
+        if reason is None:
+            return self.llm, prompt
+        print(f"Turn budget exhausted ({reason}); forcing a final answer in {node}")
+        metrics.increment(f"turn_budget_exhausted.{reason}")
+        return self.plain_llm, [*prompt, HumanMessage(content=FORCE_FINAL_ANSWER)]
+
+    def _turn_tokens(self, state: AgentState, prompt: list[AnyMessage], output) -> int:
+        usage = getattr(output, "usage_metadata", None) or {}
+        used = usage.get("total_tokens") or self.token_budget.tokens([*prompt, output])
+        return state.get("turn_tokens", 0) + used
+
+    def call_base_advisor(self, state: AgentState, config: RunnableConfig):
+        llm, prompt = self._budgeted(
+            state, self._base_advisor_prompt(state, config), "base_advisor"
+        )
+        started = time.perf_counter()
+        output = llm.invoke(prompt)
+        self._observe_base_advisor(started, output)
+        return {
+            **self._base_advisor_result(state, output),
+            "turn_tokens": self._turn_tokens(state, prompt, output),
+        }
+
+    async def acall_base_advisor(self, state: AgentState, config: RunnableConfig):
+        llm, prompt = self._budgeted(
+            state, self._base_advisor_prompt(state, config), "base_advisor"
+        )
+        started = time.perf_counter()
+        output = await llm.ainvoke(prompt)
+        self._observe_base_advisor(started, output)
+        return {
+            **self._base_advisor_result(state, output),
+            "turn_tokens": self._turn_tokens(state, prompt, output),
+        }
 
-    def call_base_advisor(self, state: AgentState):
+    def _observe_base_advisor(self, started: float, output):
+        """Record call latency split by warm/cold prompt prefix, and the
+        cached prompt tokens if the server reports them."""
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        last, self._last_base_advisor_call = self._last_base_advisor_call, started
+        warm = last is not None and started - last < PREFIX_CACHE_WINDOW_S
+        prefix = "warm" if warm else "cold"
+        metrics.histogram(f"llm_latency_ms.base_advisor.{prefix}").observe(elapsed_ms)
+        usage = getattr(output, "usage_metadata", None) or {}
+        cached = (usage.get("input_token_details") or {}).get("cache_read")
+        if cached:
+            metrics.increment("prompt_cached_tokens.base_advisor", cached)
+
+    def _base_advisor_prompt(self, state: AgentState, config: RunnableConfig):
         print("===== Calling Base Advisor Agent =====")
         messages = state["messages"]
-        prompt = generate_base_prompt(self.user, messages)
-        est = count_tokens_approximately(prompt)
-        print(f"Base Advisor prompt tokens: {est}")
+        prompt, report = self.token_budget.fit(
+            generate_base_prompt(run_user(config), messages, state.get("summary", "")),
+            "base_advisor",
+        )
+        print(
+            f"Base Advisor prompt tokens: {report.tokens_after} "
+            f"(untrimmed {report.tokens_before}, dropped {report.messages_dropped} messages)"
+        )
+        return prompt
 
-        output = self.llm.invoke(prompt)
+    def _base_advisor_result(self, state: AgentState, output):
         # Check for tool calls
         if hasattr(output, "tool_calls") and output.tool_calls:
             # The agent wants to use tools - return the AI message with tool calls
@@ -149,6 +456,7 @@ class ReActAgent:
             parsed = BaseAgentOutputSchema.model_validate_json(output.content)  # type: ignore
             if parsed.loan_id_to_apply is not None:
                 return {"loan_to_apply": parsed.loan_id_to_apply}
+            self._remember_response(state)
             return {
                 "loan_to_apply": None,
                 "messages": [AIMessage(content=parsed.response)],
@@ -163,38 +471,180 @@ class ReActAgent:
                 "messages": [AIMessage(content=output.content)],
             }
 
-    def call_eligibility_agent(self, state: AgentState):
+    @staticmethod
+    def _standalone_question(state: AgentState) -> str | None:
+        """The question of a thread's first turn, None on any later turn.
+
+        Later questions may be follow-ups that make no sense on their own, so
+        only first turns are stored in or served from the response cache.
+        """
+        if state.get("summary"):
+            return None
+        messages = state["messages"]
+        humans = [m for m in messages if isinstance(m, HumanMessage)]
+        if len(humans) != 1 or messages[0] is not humans[0]:
+            return None
+        return str(humans[0].content)
+
+    def _remember_response(self, state: AgentState):
+        """Cache an answer if the turn was a standalone knowledge question.
+
+        The turn's own answer was written with the user's profile in the
+        prompt, so the cached answer is generated again without it, in the
+        background.
+        """
+        # a forced answer may be missing what the tools would have found
+        if self.response_cache is None or self._budget_exhausted(state):
+            return
+        question = self._standalone_question(state)
+        if question is None:
+            return
+        messages = state["messages"]
+        tools_used = {
+            call["name"]
+            for m in messages
+            if isinstance(m, AIMessage)
+            for call in m.tool_calls
+        }
+        if tools_used and tools_used <= KNOWLEDGE_TOOLS:
+            _shared_answer_executor.submit(
+                self._store_shared_answer, question, list(messages)
+            )
+
+    def _store_shared_answer(self, question: str, messages: list[AnyMessage]):
+        try:
+            prompt, _ = self.token_budget.fit(
+                generate_base_prompt(None, messages), "shared_answer"
+            )
+            output = self.plain_llm.invoke(prompt)
+            parsed = BaseAgentOutputSchema.model_validate_json(output.content)  # type: ignore
+            if parsed.loan_id_to_apply is None:
+                self.response_cache.put(question, parsed.response)  # type: ignore
+        except Exception as e:
+            print(f"Error generating shared answer: {e}")
+            metrics.increment("response_cache.store_errors")
+
+    def cached_response(self, state: AgentState):
+        text = self._standalone_question(state)
+        if text is None:
+            return {}
+        return self._cached_response_result(self._lookup_response(text))
+
+    async def acached_response(self, state: AgentState):
+        text = self._standalone_question(state)
+        if text is None:
+            return {}
+        # a semantic lookup embeds the question and may ask the Guardian
+        hit = await asyncio.to_thread(self._lookup_response, text)
+        return self._cached_response_result(hit)
+
+    def _lookup_response(self, text: str) -> tuple[str, str] | None:
+        hit = self.response_cache.get(text)  # type: ignore
+        if hit is None:
+            return None
+        # An exact hit is a question that already passed moderation. A
+        # semantic one is new text and needs the Guardian's verdict; the
+        # local tier is not enough to skip it.
+        if hit[1] == "semantic":
+            verdict = moderation.VERDICT_CACHE.get(text, self.detectors)
+            if verdict is None:
+                verdict = moderation.guardian_verdict(
+                    self.guardian, text, self.detectors
+                )
+                moderation.VERDICT_CACHE.put(text, self.detectors, verdict)
+            if verdict != "safe":
+                return None
+        return hit
+
+    def _cached_response_result(self, hit: tuple[str, str] | None):
+        if hit is None:
+            return {}
+        answer, kind = hit
+        print(f"Answer served from response cache ({kind})")
+        return {
+            "messages": [AIMessage(content=answer)],
+            "moderation_verdict": "safe",
+            "loan_to_apply": None,
+        }
+
+    def call_eligibility_agent(self, state: AgentState, config: RunnableConfig):
+        prepared = self._prepare_eligibility(state, config)
+        if isinstance(prepared, dict):
+            return prepared
+        loan, prompt = prepared
+        if self._budget_exhausted(state):
+            return self._incomplete_assessment(state, loan)
+        output = self.llm.invoke(prompt)
+        return {
+            **self._eligibility_result(run_user(config), loan, output),
+            "turn_tokens": self._turn_tokens(state, prompt, output),
+        }
+
+    async def acall_eligibility_agent(self, state: AgentState, config: RunnableConfig):
+        # the DAL reads and the decision write are local SQLite calls
+        prepared = self._prepare_eligibility(state, config)
+        if isinstance(prepared, dict):
+            return prepared
+        loan, prompt = prepared
+        if self._budget_exhausted(state):
+            return self._incomplete_assessment(state, loan)
+        output = await self.llm.ainvoke(prompt)
+        return {
+            **self._eligibility_result(run_user(config), loan, output),
+            "turn_tokens": self._turn_tokens(state, prompt, output),
+        }
+
+    def _prepare_eligibility(
+        self, state: AgentState, config: RunnableConfig
+    ) -> dict | tuple[Loan, list[AnyMessage]]:
+        """Return the node result if no LLM call is needed, else (loan, prompt)."""
         print("===== Calling Eligibility Agent =====")
+        user = run_user(config)
         loan_id = state["loan_to_apply"]
         if loan_id is None:
             return {"messages": [AIMessage(content="No loan application detected.")]}
         # query loan details from database later, now just create a dummy loan
-        loan = dal.get_specific_loan(self.db_conn, loan_id)
-        if loan is None:
-            return {"messages": [AIMessage(content="Loan not found.")]}
-        user_loans = dal.get_user_loans(self.db_conn, self.user.user_id)
-        prompt = generate_eligibility_prompt(self.user, loan, user_loans)
-        output = self.llm.invoke(prompt)
+        with metrics.caller("eligibility_agent"):
+            loan = dal.get_specific_loan(self.db_conn, loan_id)
+            if loan is None:
+                return {"messages": [AIMessage(content="Loan not found.")]}
+            user_loans = dal.get_user_loans(self.db_conn, user.user_id)
+        check = eligibility.precheck(user, loan, user_loans)
+        print(f"Eligibility precheck: {check.decision} (DTI {check.dti:.2f})")
+        if check.decision != "borderline":
+            metrics.increment(f"eligibility.rules_{check.decision}")
+            return self._record_decision(
+                user, loan, self._rules_decision(loan, check), "rules"
+            )
+
+        metrics.increment("eligibility.llm")
+        return loan, generate_eligibility_prompt(user, loan, user_loans, check)
+
+    def _incomplete_assessment(self, state: AgentState, loan: Loan):
+        """Give up on an assessment whose turn budget ran out.
+
+        A decision forced without the tool results it asked for is not
+        trusted, so nothing is recorded and the user can apply again.
+        """
+        reason = self._budget_exhausted(state)
+        print(f"Turn budget exhausted ({reason}); eligibility assessment abandoned")
+        metrics.increment(f"turn_budget_exhausted.{reason}")
+        metrics.increment("eligibility.incomplete")
+        return {
+            "loan_to_apply": None,
+            "messages": [
+                AIMessage(
+                    content=f"Sorry, the assessment of your application for the {loan.type} loan (ID:{loan.loan_id}) could not be completed. No decision has been recorded; please try applying again."
+                )
+            ],
+        }
+
+    def _eligibility_result(self, user: User, loan: Loan, output):
         if hasattr(output, "tool_calls") and output.tool_calls:
             # The agent wants to use tools - return the AI message with tool calls
-            return {"messages": [output], "loan_to_apply": loan_id}
+            return {"messages": [output], "loan_to_apply": loan.loan_id}
         try:
             parsed = EligibilityAgentOutputSchema.model_validate_json(output.content)  # type: ignore
-            if parsed.application_eligible:
-                application_record = parsed.assessment_record
-                dal.add_user_loan_record(
-                    self.db_conn,
-                    self.user.user_id,
-                    loan.loan_id,
-                    application_record,
-                )
-                print("Added loan application record to database.")
-            else:
-                print("Application not eligible; no record added.")
-            return {
-                "loan_to_apply": None,
-                "messages": [AIMessage(content=parsed.user_message)],
-            }
         except Exception as e:
             print(
                 "Error parsing LLM output:",
@@ -204,33 +654,172 @@ class ReActAgent:
                 "loan_to_apply": None,
                 "messages": [AIMessage(content=output.content)],
             }
+        return self._record_decision(user, loan, parsed, "llm")
+
+    def _rules_decision(
+        self, loan: Loan, check: eligibility.PrecheckResult
+    ) -> EligibilityAgentOutputSchema:
+        reasons = " ".join(check.reasons)
+        if check.decision == "approve":
+            user_message = f"Congratulations! Your application for the {loan.type} loan (ID:{loan.loan_id}) has been approved based on your credit score and income."
+        else:
+            user_message = f"We regret to inform you that your application for the {loan.type} loan (ID:{loan.loan_id}) has been rejected. {reasons}"
+        return EligibilityAgentOutputSchema(
+            application_eligible=check.decision == "approve",
+            assessment_record=reasons,
+            user_message=user_message,
+        )
+
+    def _record_decision(
+        self,
+        user: User,
+        loan: Loan,
+        decision: EligibilityAgentOutputSchema,
+        source: eligibility.DecisionSource,
+    ):
+        record = eligibility.with_decision_source(decision.assessment_record, source)
+        print("Assessment record:", record)
+        if decision.application_eligible:
+            with metrics.caller("eligibility_agent"):
+                dal.add_user_loan_record(
+                    self.db_conn,
+                    user.user_id,
+                    loan.loan_id,
+                    record,
+                )
+            print("Added loan application record to database.")
+        else:
+            print("Application not eligible; no record added.")
+        return {
+            "loan_to_apply": None,
+            "messages": [AIMessage(content=decision.user_message)],
+        }
+
+    def _run_tool(self, tool_call) -> tuple[ToolMessage, float]:
+        """Invoke one tool call, turning any failure into an error ToolMessage."""
+        print("Invoking tool:", tool_call["name"], "with args:", tool_call["args"])
+        started = time.perf_counter()
+        try:
+            with metrics.caller(tool_call["name"]):
+                result = self.tools[tool_call["name"]].invoke(tool_call["args"])
+            content = str(result)
+        except Exception as e:
+            print(f"Error invoking tool {tool_call['name']}: {e}")
+            metrics.increment("tool_errors")
+            content = f"Error invoking tool: {e}"
+        return self._tool_message(tool_call, content, started)
+
+    async def _arun_tool(self, tool_call) -> tuple[ToolMessage, float]:
+        """Async `_run_tool` with the per-tool timeout applied."""
+        print("Invoking tool:", tool_call["name"], "with args:", tool_call["args"])
+        timeout = self.tool_timeouts.get(tool_call["name"], DEFAULT_TOOL_TIMEOUT_S)
+        started = time.perf_counter()
+        try:
+            with metrics.caller(tool_call["name"]):
+                result = await asyncio.wait_for(
+                    self.tools[tool_call["name"]].ainvoke(tool_call["args"]), timeout
+                )
+            content = str(result)
+        except asyncio.TimeoutError:
+            print(f"Tool {tool_call['name']} timed out after {timeout}s")
+            metrics.increment("tool_timeouts")
+            content = f"Error invoking tool: timed out after {timeout} seconds"
+        except Exception as e:
+            print(f"Error invoking tool {tool_call['name']}: {e}")
+            metrics.increment("tool_errors")
+            content = f"Error invoking tool: {e}"
+        return self._tool_message(tool_call, content, started)
+
+    def _tool_message(
+        self, tool_call, content: str, started: float
+    ) -> tuple[ToolMessage, float]:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.histogram(f"tool_latency_ms.{tool_call['name']}").observe(elapsed_ms)
+        message = ToolMessage(
+            tool_call_id=tool_call["id"], name=tool_call["name"], content=content
+        )
+        return message, elapsed_ms
+
+    def _skip_tools(self, state: AgentState, reason: str):
+        """Answer pending tool calls without running them."""
+        tool_calls = state["messages"][-1].tool_calls  # type: ignore
+        print(
+            f"Skipping {len(tool_calls)} tool calls: turn budget exhausted ({reason})"
+        )
+        return {
+            "messages": [
+                ToolMessage(
+                    tool_call_id=t["id"],
+                    name=t["name"],
+                    content=f"Not run: this turn's {reason} budget is used up.",
+                )
+                for t in tool_calls
+            ],
+            "loan_to_apply": state["loan_to_apply"],
+        }
 
     def call_tools(self, state: AgentState):
+        reason = self._budget_exhausted(state)
+        if reason is not None:
+            return self._skip_tools(state, reason)
         tool_calls = state["messages"][-1].tool_calls  # type: ignore
         print("Tool calls:", len(tool_calls))
+        started = time.perf_counter()
+        # copy the context so metrics.caller tags survive the thread hop
+        futures = [
+            _tool_executor.submit(contextvars.copy_context().run, self._run_tool, t)
+            for t in tool_calls
+        ]
         results = []
-        for t in tool_calls:
-            print("Invoking tool:", t["name"], "with args:", t["args"])
+        sequential_ms = 0.0
+        for t, future in zip(tool_calls, futures):
+            timeout = self.tool_timeouts.get(t["name"], DEFAULT_TOOL_TIMEOUT_S)
+            remaining = started + timeout - time.perf_counter()
             try:
-                result = self.tools[t["name"]].invoke(t["args"])
-                results.append(
-                    ToolMessage(
-                        tool_call_id=t["id"], name=t["name"], content=str(result)
-                    )
-                )
-            except Exception as e:
-                print(f"Error invoking tool {t['name']}: {e}")
-                results.append(
-                    ToolMessage(
-                        tool_call_id=t["id"],
-                        name=t["name"],
-                        content=f"Error invoking tool: {e}",
-                    )
+                message, elapsed_ms = future.result(timeout=max(0.0, remaining))
+                sequential_ms += elapsed_ms
+            except FutureTimeoutError:
+                future.cancel()
+                print(f"Tool {t['name']} timed out after {timeout}s")
+                metrics.increment("tool_timeouts")
+                message = ToolMessage(
+                    tool_call_id=t["id"],
+                    name=t["name"],
+                    content=f"Error invoking tool: timed out after {timeout} seconds",
                 )
+                sequential_ms += timeout * 1000
+            results.append(message)
+        return self._tool_round_result(state, results, started, sequential_ms)
+
+    async def acall_tools(self, state: AgentState):
+        reason = self._budget_exhausted(state)
+        if reason is not None:
+            return self._skip_tools(state, reason)
+        tool_calls = state["messages"][-1].tool_calls  # type: ignore
+        print("Tool calls:", len(tool_calls))
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(self._arun_tool(t) for t in tool_calls))
+        results = [message for message, _ in outcomes]
+        sequential_ms = sum(elapsed_ms for _, elapsed_ms in outcomes)
+        return self._tool_round_result(state, results, started, sequential_ms)
+
+    def _tool_round_result(
+        self,
+        state: AgentState,
+        results: list[ToolMessage],
+        started: float,
+        sequential_ms: float,
+    ):
+        wall_ms = (time.perf_counter() - started) * 1000
+        saved_ms = max(0.0, sequential_ms - wall_ms)
+        metrics.histogram("tool_round_wall_ms").observe(wall_ms)
+        metrics.histogram("tool_round_saved_ms").observe(saved_ms)
+        print(f"Tool round took {wall_ms:.0f} ms, saved {saved_ms:.0f} ms")
         return {
             "messages": results,
-            "loan_to_apply": state["loan_to_apply"],
-        }  # preserve loan_to_apply
+            "loan_to_apply": state["loan_to_apply"],  # preserve loan_to_apply
+            "tool_rounds": state.get("tool_rounds", 0) + 1,
+        }
 
     def should_call_base_advisor_tools(self, state: AgentState):
         result = state["messages"][-1]
@@ -245,22 +834,80 @@ class ReActAgent:
         return "eligibility_agent" if loan_id is not None else END
 
     def guardian_moderation(self, state: AgentState):
-        message = state["messages"][-1]
-        detectors = {
-            "hap": {},
-            "granite_guardian": {"risk_name": "harm", "threshold": 0.6},
-            "topic_relevance": {"threshold": 0.5},
-            "pii": {},
-        }
-        guardian = Guardian(api_client=self.client, detectors=detectors)
-        response = guardian.detect(text=message.content, detectors=detectors)  # type: ignore
-        if (
-            len(response["detections"]) != 0
-            and response["detections"][0]["detection"] == "Yes"
-        ):
-            return {"moderation_verdict": "inappropriate"}
-        else:
-            return {"moderation_verdict": "safe"}
+        text = str(state["messages"][-1].content)
+        verdict = self._known_verdict(text)
+        if verdict is None:
+            verdict = moderation.guardian_verdict(self.guardian, text, self.detectors)
+            moderation.VERDICT_CACHE.put(text, self.detectors, verdict)
+        return {"moderation_verdict": verdict}
+
+    async def aguardian_moderation(self, state: AgentState):
+        text = str(state["messages"][-1].content)
+        verdict = self._known_verdict(text)
+        if verdict is None:
+            # the Guardian client is synchronous; keep it off the event loop
+            verdict = await asyncio.to_thread(
+                moderation.guardian_verdict, self.guardian, text, self.detectors
+            )
+            moderation.VERDICT_CACHE.put(text, self.detectors, verdict)
+        return {"moderation_verdict": verdict}
+
+    def _known_verdict(self, text: str) -> str | None:
+        """Verdict from the local tier or the cache, None if the remote
+        detectors must be consulted."""
+        if self.pre_moderator is not None:
+            local = self.pre_moderator.check(text)
+            if local.verdict is not None:
+                print(f"Local moderation: {local.verdict} (score {local.score:.2f})")
+                return local.verdict
+        verdict = moderation.VERDICT_CACHE.get(text, self.detectors)
+        if verdict is not None:
+            print("Moderation verdict served from cache")
+        return verdict
+
+    def speculative_moderation(self, state: AgentState, config: RunnableConfig):
+        """Run moderation and the first base-advisor call at the same time.
+
+        The advisor call only produces an LLM message; tools and application
+        writes run in later nodes, i.e. strictly after the verdict. If the
+        message is blocked or moderation fails, the advisor result is
+        discarded.
+        """
+        advisor = _speculation_executor.submit(
+            contextvars.copy_context().run, self.call_base_advisor, state, config
+        )
+        try:
+            verdict = self.guardian_moderation(state)["moderation_verdict"]
+        except BaseException:
+            advisor.cancel()
+            metrics.increment("speculation.discarded")
+            raise
+        if verdict == "inappropriate":
+            advisor.cancel()
+            metrics.increment("speculation.discarded")
+            return {"moderation_verdict": verdict}
+        metrics.increment("speculation.used")
+        return {"moderation_verdict": verdict, **advisor.result()}
+
+    async def aspeculative_moderation(self, state: AgentState, config: RunnableConfig):
+        advisor = asyncio.ensure_future(self.acall_base_advisor(state, config))
+        try:
+            verdict = (await self.aguardian_moderation(state))["moderation_verdict"]
+        except BaseException:
+            _discard_task(advisor)
+            raise
+        if verdict == "inappropriate":
+            _discard_task(advisor)
+            return {"moderation_verdict": verdict}
+        metrics.increment("speculation.used")
+        return {"moderation_verdict": verdict, **(await advisor)}
+
+    def route_after_speculation(self, state: AgentState):
+        if state["moderation_verdict"] == "inappropriate":
+            return "block_message"
+        if self.should_call_base_advisor_tools(state) != END:
+            return "base_agent_tools"
+        return self.should_apply_loan(state)
 
     def block_message(self, state: AgentState):
         return {
@@ -270,3 +917,141 @@ class ReActAgent:
                 )
             ]
         }
+
+
+class ReActAgent:
+    """One user's conversation on the shared `AgentRuntime`.
+
+    Holds only the user and the runtime, so sessions are cheap to create.
+    """
+
+    def __init__(self, user: User, runtime: AgentRuntime):
+        self.user = user
+        self.runtime = runtime
+
+    def thread_id(self):
+        return str(self.user.user_id)
+
+    def config(self) -> RunnableConfig:
+        # the checkpointer keys on thread_id; nodes read the user
+        return {"configurable": {"thread_id": self.thread_id(), "user": self.user}}
+
+    def invoke(self, user_input: str):
+        """
+        Wrap a user input and call the compiled graph while supplying the thread_id
+        so the checkpointer stores/retrieves the conversation.
+        """
+        messages = [HumanMessage(content=user_input)]
+        # LangGraph expects state dict and a config; thread id and user go under configurable
+        config = self.config()
+        started = time.perf_counter()
+        result = self.runtime.graph.invoke({"messages": messages}, config)  # type: ignore
+        self._after_turn(started)
+        return result
+
+    def stream(self, user_input: str, stream_mode="updates"):
+        """Yield graph events for one turn as the nodes complete."""
+        messages = [HumanMessage(content=user_input)]
+        config = self.config()
+        started = time.perf_counter()
+        yield from self.runtime.graph.stream(
+            {"messages": messages}, config, stream_mode=stream_mode  # type: ignore
+        )
+        self._after_turn(started)
+
+    def stream_response(self, user_input: str) -> Iterator[str]:
+        """Yield the reply text while the LLM generates it.
+
+        Only the user-facing field of each advisor or eligibility answer is
+        streamed. Text from the speculative advisor call is held back until
+        the guardian reports a safe verdict. If the final message differs from
+        the streamed text (blocked message, rules decision, a reply followed by
+        an eligibility decision), it is yielded at the end.
+        """
+        config = self.config()
+        started = time.perf_counter()
+        parsers: dict[str, streaming.JsonFieldStreamer] = {}
+        held: list[tuple[str, str]] = []
+        segment_id, segment = None, ""
+        first = True
+
+        def pieces(call_id: str, text: str) -> list[str]:
+            nonlocal segment_id, segment, first
+            out = []
+            if first:
+                first = False
+                metrics.histogram("turn_ttft_ms").observe(
+                    (time.perf_counter() - started) * 1000
+                )
+            if call_id != segment_id:
+                if segment:
+                    out.append("\n\n")
+                segment_id, segment = call_id, ""
+            segment += text
+            out.append(text)
+            return out
+
+        for mode, payload in self.stream(user_input, ["messages", "updates"]):
+            if mode == "updates":
+                verdict = (payload.get("guardian") or {}).get("moderation_verdict")
+                if verdict == "safe":
+                    for call_id, text in held:
+                        yield from pieces(call_id, text)
+                held.clear()
+                continue
+            chunk, meta = payload
+            node = meta.get("langgraph_node")
+            if node not in STREAMED_FIELDS or not isinstance(chunk, AIMessageChunk):
+                continue
+            if not isinstance(chunk.content, str) or not chunk.content:
+                continue
+            call_id = chunk.id or node
+            parser = parsers.setdefault(
+                call_id, streaming.JsonFieldStreamer(STREAMED_FIELDS[node])
+            )
+            text = parser.feed(chunk.content)
+            if not text:
+                continue
+            if node == "guardian":
+                held.append((call_id, text))
+            else:
+                yield from pieces(call_id, text)
+
+        final = self.runtime.graph.get_state(config).values["messages"][-1]  # type: ignore
+        final_text = str(final.content)
+        if final_text.strip() != segment.strip():
+            yield from pieces(str(final.id), final_text)
+
+    async def ainvoke(self, user_input: str):
+        """Async `invoke`: nodes await the LLM, RAG and tools on the event loop."""
+        messages = [HumanMessage(content=user_input)]
+        config = self.config()
+        started = time.perf_counter()
+        result = await self.runtime.graph.ainvoke({"messages": messages}, config)  # type: ignore
+        self._after_turn(started)
+        return result
+
+    async def astream(self, user_input: str, stream_mode: str = "updates"):
+        """Yield graph events for one turn as the nodes complete."""
+        messages = [HumanMessage(content=user_input)]
+        config = self.config()
+        started = time.perf_counter()
+        async for event in self.runtime.graph.astream(
+            {"messages": messages}, config, stream_mode=stream_mode  # type: ignore
+        ):
+            yield event
+        self._after_turn(started)
+
+    def _after_turn(self, started: float):
+        mode = "speculative" if self.runtime.speculative else "sequential"
+        metrics.histogram(f"turn_latency_ms.{mode}").observe(
+            (time.perf_counter() - started) * 1000
+        )
+        self.runtime._schedule_summary(self.thread_id())
+
+    def clear_memory(self):
+        self.runtime.clear_thread(self.thread_id())
+
+    def change_user(self, user: User):
+        self.user = user
+        self.clear_memory()
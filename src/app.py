@@ -2,15 +2,58 @@ import streamlit as st
 from model import User
 import dal
 from sqlite3 import Connection as SQLiteConnection
-from agent import ReActAgent
-from db import init_db
+from agent import AgentRuntime, ReActAgent, TurnBudget
+from sessions import AgentPool
+from db import init_db, ReadOnlyDB
+from checkpointer import SQLiteCheckpointer
+from tool_outputs import ToolOutputStore
+from response_cache import ResponseCache
 from rag import RAG
 from tools import get_tools
+from token_budget import TokenBudget
 from llm import get_model
-from state import get_app_state, ChatMessage, get_welcome_message
+from state import get_app_state, ChatMessage, SharedResources, get_welcome_message
 from datetime import datetime
+import os
+import metrics
+import moderation
+import tool_cache
 import utils
 
+DB_PATH = os.getenv("LOAN_ASSISTANT_DB", "data/loan_assistant.db")
+# Conversation checkpoints, kept apart from the application database.
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "data/checkpoints.db")
+CHECKPOINT_MAX_PER_THREAD = int(os.getenv("CHECKPOINT_MAX_PER_THREAD", "20"))
+CHECKPOINT_IDLE_TTL_S = float(os.getenv("CHECKPOINT_IDLE_TTL_S", str(7 * 24 * 3600)))
+# Run moderation concurrently with the first advisor call (see AgentRuntime).
+SPECULATIVE_MODERATION = os.getenv("SPECULATIVE_MODERATION", "0") == "1"
+# Local pre-moderation tier (off by default); messages scoring between the two
+# thresholds are escalated to the remote Guardian detectors.
+LOCAL_MODERATION = os.getenv("LOCAL_MODERATION", "0") == "1"
+LOCAL_MODERATION_SAFE_BELOW = float(os.getenv("LOCAL_MODERATION_SAFE_BELOW", "0.2"))
+LOCAL_MODERATION_BLOCK_ABOVE = float(os.getenv("LOCAL_MODERATION_BLOCK_ABOVE", "0.9"))
+LOCAL_MODERATION_MODEL = os.getenv("LOCAL_MODERATION_MODEL")
+# Input-token ceiling for base advisor calls and the number of most recent
+# conversation turns kept whole while they fit.
+PROMPT_MAX_INPUT_TOKENS = int(os.getenv("PROMPT_MAX_INPUT_TOKENS", "8000"))
+PROMPT_KEEP_LAST_TURNS = int(os.getenv("PROMPT_KEEP_LAST_TURNS", "3"))
+# Conversations longer than this (in tokens) are summarized in the background;
+# 0 disables summarization.
+SUMMARIZE_AFTER_TOKENS = int(os.getenv("SUMMARIZE_AFTER_TOKENS", "6000"))
+# Share answers to knowledge-only questions across users. Differently worded
+# questions match by embedding similarity above RESPONSE_CACHE_SIMILARITY.
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "1") == "1"
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+# Per-turn limits on the agents' tool loops; when one is reached the agent
+# stops calling tools and answers with what it has.
+TURN_MAX_TOOL_ROUNDS = int(os.getenv("TURN_MAX_TOOL_ROUNDS", "6"))
+TURN_MAX_TOKENS = int(os.getenv("TURN_MAX_TOKENS", "60000"))
+TURN_MAX_WALL_S = float(os.getenv("TURN_MAX_WALL_S", "90"))
+# Per-user agent sessions kept in memory; idle ones are rebuilt on demand
+# from the checkpointer.
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", "256"))
+AGENT_IDLE_TTL_S = float(os.getenv("AGENT_IDLE_TTL_S", "1800"))
+
 
 def chat_ui():
     """Modern chat UI using Streamlit chat primitives and typed AppState."""
@@ -43,33 +86,26 @@ def chat_ui():
         with st.chat_message("user"):
             st.write(user_input)
 
-        # Call agent with spinner
-        ag = state.agent
+        # Call the current user's agent
+        user = next(
+            (u for u in state.users if u.user_id == state.current_user_id), None
+        )
 
+        # Stream the reply as it is generated instead of waiting for the turn
         with st.chat_message("assistant"):
-            with st.spinner("LoanGuide is thinking..."):
-                try:
-                    if ag is None:
-                        assistant_response = "(Agent unavailable)"
-                    else:
-                        result = ag.invoke(user_input)
-                        # result may be a dict with messages or a raw string
-                        if (
-                            isinstance(result, dict)
-                            and "messages" in result
-                            and result["messages"]
-                        ):
-                            last = result["messages"][-1]
-                            # prefer attribute .content if present
-                            raw = getattr(last, "content", last)
-                        else:
-                            raw = result
-
-                        assistant_response = utils.normalize_text(raw)
-                except Exception as e:
-                    print("Agent invocation error:", e)
-                    assistant_response = f"(Agent error) {e}"
-
+            try:
+                if state.agents is None or user is None:
+                    assistant_response = "(Agent unavailable)"
+                    st.write(assistant_response)
+                else:
+                    with state.agents.session(user) as ag:
+                        assistant_response = st.write_stream(
+                            utils.normalize_text(text)
+                            for text in ag.stream_response(user_input)
+                        )
+            except Exception as e:
+                print("Agent invocation error:", e)
+                assistant_response = f"(Agent error) {e}"
                 st.write(assistant_response)
 
         # Persist assistant response in UI history
@@ -91,7 +127,8 @@ def applied_loans_page(selected_user: User, db_conn: SQLiteConnection):
 
     # Fetch applied loans for user
     try:
-        loans = dal.get_user_loans(db_conn, selected_user.user_id)
+        with metrics.caller("applied_loans_page"):
+            loans = dal.get_user_loans(db_conn, selected_user.user_id)
     except Exception:
         loans = []
 
@@ -129,6 +166,190 @@ def applied_loans_page(selected_user: User, db_conn: SQLiteConnection):
     )
 
 
+def query_stats_panel():
+    """Sidebar debug panel with DAL query latency, row counts and slow plans."""
+    with st.sidebar.expander("🛠 DAL query stats"):
+        config = dal.configure_instrumentation()
+        capture_plans = st.checkbox(
+            "Capture query plans for slow queries", value=config["capture_plans"]
+        )
+        slow_query_ms = st.number_input(
+            "Slow query threshold (ms)",
+            min_value=0.0,
+            value=float(config["slow_query_ms"]),
+            step=10.0,
+        )
+        dal.configure_instrumentation(
+            slow_query_ms=slow_query_ms, capture_plans=capture_plans
+        )
+
+        stats = dal.get_query_stats()
+        if not stats:
+            st.caption("No queries recorded yet.")
+            return
+        table = []
+        for name, stat in stats.items():
+            latency = stat["latency_ms"]
+            table.append(
+                {
+                    "Query": name,
+                    "Calls": stat["calls"],
+                    "p50 ms": round(latency["p50"], 2),
+                    "p95 ms": round(latency["p95"], 2),
+                    "Max ms": round(latency["max"], 2),
+                    "Avg rows": round(stat["avg_rows"], 1),
+                    "Top caller": max(stat["callers"], key=stat["callers"].get),
+                }
+            )
+        st.dataframe(table, hide_index=True)
+
+        slow_queries = [q for stat in stats.values() for q in stat["slow_queries"]]
+        if slow_queries:
+            st.markdown("**Slow queries**")
+            for q in slow_queries[-10:]:
+                flag = " ⚠️ full scan" if q.get("full_scan") else ""
+                st.caption(f"{q['query']} ({q['caller']}) — {q['ms']} ms{flag}")
+                st.code("\n".join([q["sql"]] + q.get("plan", [])), language="sql")
+
+        if st.button("Reset query stats"):
+            dal.reset_query_stats()
+            st.rerun()
+
+
+def agent_metrics_panel():
+    """Sidebar debug panel with tool cache hit rates and agent counters."""
+    with st.sidebar.expander("📈 Agent metrics"):
+        cache_stats = tool_cache.TOOL_CACHE.stats()
+        if cache_stats:
+            st.markdown("**Tool cache**")
+            st.dataframe(
+                [
+                    {
+                        "Tool": name,
+                        "Hits": stat["hits"],
+                        "Misses": stat["misses"],
+                        "Hit rate": f"{stat['hit_rate']:.0%}",
+                    }
+                    for name, stat in cache_stats.items()
+                ],
+                hide_index=True,
+            )
+        if metrics.counter("moderation.checked"):
+            st.metric(
+                "Moderation escalated to Guardian",
+                f"{moderation.escalation_rate():.0%}",
+            )
+        snapshot = metrics.snapshot()
+        counters = {
+            name: value
+            for name, value in snapshot["counters"].items()
+            if not name.startswith("tool_cache.")
+        }
+        if counters:
+            st.markdown("**Counters**")
+            st.json(counters)
+        sections = {
+            "Latency (ms)": lambda name: not name.startswith("prompt_tokens."),
+            "Prompt size (tokens)": lambda name: name.startswith("prompt_tokens."),
+        }
+        for title, include in sections.items():
+            rows = [
+                {
+                    "Metric": name,
+                    "Count": h["count"],
+                    "p50": round(h["p50"], 1),
+                    "p95": round(h["p95"], 1),
+                    "Max": round(h["max"], 1),
+                }
+                for name, h in snapshot["histograms"].items()
+                if include(name)
+            ]
+            if rows:
+                st.markdown(f"**{title}**")
+                st.dataframe(rows, hide_index=True)
+        if not (cache_stats or counters or snapshot["histograms"]):
+            st.caption("No agent activity recorded yet.")
+
+
+@st.cache_resource
+def get_shared_resources() -> SharedResources:
+    """Build the model clients, stores, compiled agent graph and agent pool.
+
+    Cached by Streamlit for the whole process, so every browser session uses
+    the same agents (and per-user locks) instead of building its own.
+    """
+    llm, client = get_model()
+    db_conn, _ = init_db(DB_PATH)
+    read_db = ReadOnlyDB(DB_PATH)
+    checkpointer = SQLiteCheckpointer(
+        CHECKPOINT_DB,
+        max_checkpoints=CHECKPOINT_MAX_PER_THREAD,
+        idle_ttl_s=CHECKPOINT_IDLE_TTL_S,
+    )
+    rag = RAG("documents", "chroma_db")
+    tools = get_tools(rag, db_conn, read_db)
+
+    pre_moderator = None
+    if LOCAL_MODERATION:
+        pre_moderator = moderation.LocalModerator(
+            safe_below=LOCAL_MODERATION_SAFE_BELOW,
+            block_above=LOCAL_MODERATION_BLOCK_ABOVE,
+            classifier=(
+                moderation.load_classifier(LOCAL_MODERATION_MODEL)
+                if LOCAL_MODERATION_MODEL
+                else None
+            ),
+        )
+    token_budget = TokenBudget(
+        max_input_tokens=PROMPT_MAX_INPUT_TOKENS,
+        keep_last_turns=PROMPT_KEEP_LAST_TURNS,
+    )
+    # compacted tool outputs live next to the checkpoints
+    tool_store = ToolOutputStore(CHECKPOINT_DB)
+    response_cache = None
+    if RESPONSE_CACHE:
+        response_cache = ResponseCache(
+            embed=rag.embeddings.embed_query if rag.embeddings else None,
+            similarity=RESPONSE_CACHE_SIMILARITY,
+        )
+
+    # The graph is compiled once; each user's agent is a light session on it
+    runtime = AgentRuntime(
+        llm,
+        client,
+        tools,
+        db_conn,
+        speculative_moderation=SPECULATIVE_MODERATION,
+        pre_moderator=pre_moderator,
+        token_budget=token_budget,
+        summarize_after_tokens=SUMMARIZE_AFTER_TOKENS or None,
+        checkpointer=checkpointer,
+        tool_store=tool_store,
+        response_cache=response_cache,
+        turn_budget=TurnBudget(
+            max_tool_rounds=TURN_MAX_TOOL_ROUNDS,
+            max_tokens=TURN_MAX_TOKENS,
+            max_wall_s=TURN_MAX_WALL_S,
+        ),
+    )
+    agents = AgentPool(
+        lambda user: ReActAgent(user, runtime),
+        max_sessions=AGENT_POOL_SIZE,
+        idle_ttl_s=AGENT_IDLE_TTL_S,
+    )
+    return SharedResources(
+        llm=llm,
+        client=client,
+        db_conn=db_conn,
+        read_db=read_db,
+        checkpointer=checkpointer,
+        rag=rag,
+        tools=tools,
+        runtime=runtime,
+        agents=agents,
+    )
+
+
 def main():
     st.set_page_config(page_title="Loan Assistant", layout="wide")
 
@@ -136,51 +357,37 @@ def main():
     # Use a typed AppState container to hold session resources
     state = get_app_state()
 
-    # Initialize heavy resources once and keep them in the typed AppState
+    # Shared resources are built once per process; the session keeps references
     if not state.resources_initialized:
-        llm, client = get_model()
-        db_conn, _ = init_db("data/loan_assistant.db")
-        rag = RAG("documents", "chroma_db")
-        tools = get_tools(rag, db_conn)
-        users = dal.get_users(db_conn)
-
-        state.llm = llm
-        state.client = client
-        state.db_conn = db_conn
-        state.rag = rag
-        state.tools = tools
+        shared = get_shared_resources()
+        users = dal.get_users(shared.db_conn)
+
+        state.llm = shared.llm
+        state.client = shared.client
+        state.db_conn = shared.db_conn
+        state.read_db = shared.read_db
+        state.checkpointer = shared.checkpointer
+        state.rag = shared.rag
+        state.tools = shared.tools
+        state.agents = shared.agents
         state.users = users
 
-        # Create agent instance once. Agent will be instructed to switch users
         initial_user = users[0] if users else None
         if initial_user is None:
             st.sidebar.error("No users found in the database.")
             return
-        try:
-            state.agent = ReActAgent(initial_user, llm, client, tools, db_conn)
-        except Exception:
-            # Fallback: leave agent as None
-            state.agent = None
-
         state.current_user_id = getattr(initial_user, "user_id", None)
         state.applied_loans = (
-            dal.get_user_loans(db_conn, state.current_user_id)
+            dal.get_user_loans(shared.db_conn, state.current_user_id)
             if state.current_user_id
             else []
         )
         state.resources_initialized = True
-        # ensure local reference to agent exists in this run (other locals were already assigned above)
-        agent = state.agent
-    else:
-        llm = state.llm
-        client = state.client
-        db_conn = state.db_conn
-        rag = state.rag
-        tools = state.tools
-        users = state.users
-        agent = state.agent
+    db_conn = state.db_conn
+    users = state.users
+    agents = state.agents
     # just for type checking
-    if db_conn is None or agent is None:
+    if db_conn is None or agents is None:
         st.sidebar.error("Failed to initialize resources.")
         return
     # Sidebar: user selector + natural navigation
@@ -220,18 +427,15 @@ def main():
     if selected is None:
         st.sidebar.error("Selected user not found.")
         return
-    # If user changed, notify the agent and refresh applied loans from DB
+    # If user changed, switch to their chat and refresh applied loans from DB.
+    # Each user has their own agent, so no conversation is lost.
     prev_id = state.current_user_id
     if selected and prev_id != selected.user_id:
-        # Update agent user context if supported
-        ag = state.agent
-        if ag is not None:
-            try:
-                ag.change_user(selected)
-            except Exception:
-                pass
-        # refresh chat history
-        state.chat_history = [get_welcome_message()]
+        if prev_id is not None:
+            state.chat_histories[prev_id] = state.chat_history
+        state.chat_history = state.chat_histories.pop(
+            selected.user_id, [get_welcome_message()]
+        )
         # Refresh applied loans from DB for the new user
         try:
             state.applied_loans = dal.get_user_loans(db_conn, selected.user_id)
@@ -256,7 +460,9 @@ def main():
 
     if st.sidebar.button("🧹 Clear chat"):
         state.chat_history = [get_welcome_message()]
-        agent.clear_memory()
+        # wait for any turn of this user's (other tabs share the pool) to finish
+        with agents.session(selected) as ag:
+            ag.clear_memory()
         st.rerun()
     if page == "Chat":
         # Use the modern chat UI which reads the persistent agent from AppState
@@ -264,13 +470,17 @@ def main():
     elif page == "Applied Loans":
         # Always fetch fresh loans when viewing the page to ensure up-to-date data
         try:
-            loans = dal.get_user_loans(db_conn, selected.user_id)
+            with metrics.caller("applied_loans_page"):
+                loans = dal.get_user_loans(db_conn, selected.user_id)
             state.applied_loans = loans
         except Exception:
             state.applied_loans = state.applied_loans or []
 
         applied_loans_page(selected, db_conn)
 
+    query_stats_panel()
+    agent_metrics_panel()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,208 @@
+"""
+Safe arithmetic expression evaluator for the calculation tools.
+
+Expressions are parsed once, checked against a whitelist of AST nodes and
+functions (no attribute access, subscripts, lambdas or builtins), and
+compiled into a template where every numeric literal becomes a placeholder
+argument. Templates are cached, so re-evaluating an expression skips parsing,
+and a batch of expressions that share a template (e.g. hundreds of `pmt`
+calls that only differ in their numbers) is evaluated in one NumPy pass.
+"""
+
+import ast
+import math
+from functools import lru_cache
+
+import numpy as np
+
+import finance
+
+MAX_EXPRESSION_LENGTH = 1000
+
+
+def _round(x, ndigits=0):
+    scale = np.power(10.0, ndigits)
+    return np.round(np.multiply(x, scale)) / scale
+
+
+def _min(*args):
+    return np.minimum.reduce(np.broadcast_arrays(*args))
+
+
+def _max(*args):
+    return np.maximum.reduce(np.broadcast_arrays(*args))
+
+
+FUNCTIONS = {
+    "abs": np.abs,
+    "round": _round,
+    "min": _min,
+    "max": _max,
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+    "log": np.log,
+    "log10": np.log10,
+    "pow": np.power,
+    "floor": np.floor,
+    "ceil": np.ceil,
+    # financial helpers, see finance.py for sign conventions
+    "pmt": finance.pmt,
+    "pv": finance.pv,
+    "fv": finance.fv,
+    "rate": finance.rate,
+}
+
+CONSTANTS = {"pi": math.pi, "e": math.e}
+
+_BINARY_OPERATORS = (
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.FloorDiv,
+    ast.Mod,
+    ast.Pow,
+)
+_UNARY_OPERATORS = (ast.UAdd, ast.USub)
+
+
+class CalculationError(ValueError):
+    """Raised for expressions that are not allowed or cannot be evaluated."""
+
+
+class _Templater(ast.NodeTransformer):
+    """Validate nodes and replace numeric literals with `_c<i>` placeholders."""
+
+    def __init__(self):
+        self.constants: list[float] = []
+
+    def generic_visit(self, node):
+        raise CalculationError(f"unsupported syntax: {type(node).__name__}")
+
+    def visit_Expression(self, node: ast.Expression):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_Constant(self, node: ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise CalculationError(f"unsupported constant: {node.value!r}")
+        # Floats keep `**` from building huge integers and match the
+        # vectorized path, where every placeholder is a float array.
+        self.constants.append(float(node.value))
+        return ast.Name(id=f"_c{len(self.constants) - 1}", ctx=ast.Load())
+
+    def visit_Name(self, node: ast.Name):
+        if node.id not in CONSTANTS:
+            raise CalculationError(f"unknown name: {node.id}")
+        return node
+
+    def visit_BinOp(self, node: ast.BinOp):
+        if not isinstance(node.op, _BINARY_OPERATORS):
+            raise CalculationError(f"unsupported operator: {type(node.op).__name__}")
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        return node
+
+    def visit_UnaryOp(self, node: ast.UnaryOp):
+        if not isinstance(node.op, _UNARY_OPERATORS):
+            raise CalculationError(f"unsupported operator: {type(node.op).__name__}")
+        node.operand = self.visit(node.operand)
+        return node
+
+    def visit_Call(self, node: ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+            raise CalculationError(f"unknown function: {ast.unparse(node.func)}")
+        if node.keywords:
+            raise CalculationError("keyword arguments are not supported")
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+
+@lru_cache(maxsize=4096)
+def parse(expression: str) -> tuple[str, tuple[float, ...]]:
+    """Split an expression into a validated template and its numeric literals."""
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise CalculationError("expression is too long")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise CalculationError(f"invalid syntax: {e.msg}") from None
+    templater = _Templater()
+    tree = templater.visit(tree)
+    return ast.unparse(tree), tuple(templater.constants)
+
+
+@lru_cache(maxsize=1024)
+def _compile(template: str):
+    return compile(template, "<calculation>", "eval")
+
+
+def _run(template: str, constants):
+    namespace = {"__builtins__": {}, **FUNCTIONS, **CONSTANTS}
+    namespace.update({f"_c{i}": value for i, value in enumerate(constants)})
+    with np.errstate(all="ignore"):
+        return eval(_compile(template), namespace)
+
+
+def _to_number(value) -> float:
+    value = float(value)
+    if not math.isfinite(value):
+        raise CalculationError("result is not a finite number")
+    return value
+
+
+def evaluate(expression: str) -> float:
+    """Evaluate a single expression, raising CalculationError on failure."""
+    template, constants = parse(expression)
+    try:
+        return _to_number(_run(template, constants))
+    except CalculationError:
+        raise
+    except Exception as e:
+        raise CalculationError(str(e) or type(e).__name__) from None
+
+
+def evaluate_batch(expressions: list[str]) -> list[float | CalculationError]:
+    """Evaluate many expressions, vectorizing those that share a template.
+
+    Each result is either a float or the CalculationError for that
+    expression. Groups whose vectorized result is not entirely finite are
+    re-evaluated one by one so each bad expression gets its own error.
+    """
+    results: list[float | CalculationError | None] = [None] * len(expressions)
+    groups: dict[str, list[tuple[int, tuple[float, ...]]]] = {}
+    for i, expression in enumerate(expressions):
+        try:
+            template, constants = parse(expression)
+        except CalculationError as e:
+            results[i] = e
+            continue
+        groups.setdefault(template, []).append((i, constants))
+
+    for template, members in groups.items():
+        if len(members) > 1:
+            columns = np.array([c for _, c in members], dtype=float).T
+            try:
+                values = np.broadcast_to(
+                    np.asarray(_run(template, list(columns)), dtype=float),
+                    (len(members),),
+                )
+                if np.isfinite(values).all():
+                    for (i, _), value in zip(members, values):
+                        results[i] = float(value)
+                    continue
+            except Exception:
+                pass
+        for i, _ in members:
+            try:
+                results[i] = evaluate(expressions[i])
+            except CalculationError as e:
+                results[i] = e
+    return results  # type: ignore[return-value]
+
+
+def format_number(value: float) -> str:
+    """Render whole numbers without a trailing `.0`."""
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
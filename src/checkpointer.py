@@ -0,0 +1,485 @@
+"""
+SQLite-backed LangGraph checkpointer with retention limits.
+
+Replaces the in-memory `MemorySaver`, so conversation state survives
+restarts and process memory no longer grows with every user:
+
+- channel values are stored once per version (unchanged channels are not
+  rewritten by later checkpoints), msgpack-encoded and zlib-compressed when
+  large, which shrinks RAG-heavy `ToolMessage` histories considerably;
+- only the newest `max_checkpoints` checkpoints of a thread are kept;
+- threads idle for longer than `idle_ttl_s` are deleted by `compact`, which
+  also drops unreferenced values and returns free pages to the file. It runs
+  periodically on a daemon thread when `compact_interval_s` is set.
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from collections.abc import AsyncIterator, Iterator, Sequence
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+import metrics
+
+# Serialized values larger than this many bytes are zlib-compressed.
+COMPRESS_MIN_BYTES = 512
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoint_threads (
+    thread_id TEXT PRIMARY KEY,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS checkpoint_blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS checkpoint_writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver[str]):
+    def __init__(
+        self,
+        db_path: str,
+        max_checkpoints: int = 20,
+        idle_ttl_s: float | None = 7 * 24 * 3600,
+        compact_interval_s: float | None = 3600,
+    ):
+        super().__init__()
+        self.max_checkpoints = max_checkpoints
+        self.idle_ttl_s = idle_ttl_s
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            # must be set before the first table is created to take effect
+            self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+            self.conn.executescript(SCHEMA)
+            self.conn.commit()
+        self._stop = threading.Event()
+        if compact_interval_s:
+            threading.Thread(
+                target=self._compaction_loop,
+                args=(compact_interval_s,),
+                name="checkpoint-compaction",
+                daemon=True,
+            ).start()
+
+    # ----- serialization -----
+
+    def _dump(self, value: Any) -> tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(value)
+        if len(data) >= COMPRESS_MIN_BYTES:
+            return f"zlib+{type_}", zlib.compress(data, 6)
+        return type_, data
+
+    def _load(self, type_: str, data: bytes) -> Any:
+        if type_.startswith("zlib+"):
+            type_, data = type_[len("zlib+") :], zlib.decompress(data)
+        return self.serde.loads_typed((type_, data))
+
+    # ----- reads -----
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        query = (
+            "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata"
+            " FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        )
+        params: tuple = (thread_id, checkpoint_ns)
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params += (checkpoint_id,)
+        else:
+            query += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self._lock:
+            row = self.conn.execute(query, params).fetchone()
+            if row is None:
+                return None
+            return self._to_tuple(thread_id, checkpoint_ns, row)
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,"
+            " type, checkpoint, metadata FROM checkpoints WHERE 1 = 1"
+        )
+        params: tuple = ()
+        if config is not None:
+            configurable = config["configurable"]
+            query += " AND thread_id = ?"
+            params += (configurable["thread_id"],)
+            if configurable.get("checkpoint_ns") is not None:
+                query += " AND checkpoint_ns = ?"
+                params += (configurable["checkpoint_ns"],)
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params += (checkpoint_id,)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params += (before_id,)
+        query += " ORDER BY checkpoint_id DESC"
+
+        results = []
+        with self._lock:
+            for thread_id, checkpoint_ns, *row in self.conn.execute(
+                query, params
+            ).fetchall():
+                if limit is not None and len(results) >= limit:
+                    break
+                metadata = self._load("msgpack", row[4])
+                if filter and not all(
+                    metadata.get(key) == value for key, value in filter.items()
+                ):
+                    continue
+                results.append(self._to_tuple(thread_id, checkpoint_ns, row))
+        yield from results
+
+    def _to_tuple(self, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        """Build a CheckpointTuple; the caller holds the lock."""
+        checkpoint_id, parent_id, type_, checkpoint_b, metadata_b = row
+        checkpoint: Checkpoint = self._load(type_, checkpoint_b)
+        versions = checkpoint["channel_versions"]
+        channel_values = {}
+        if versions:
+            keys = list(versions.items())
+            placeholders = ", ".join(["(?, ?)"] * len(keys))
+            rows = self.conn.execute(
+                "SELECT channel, type, value FROM checkpoint_blobs"
+                " WHERE thread_id = ? AND checkpoint_ns = ?"
+                f" AND (channel, version) IN (VALUES {placeholders})",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    *[x for k, v in keys for x in (k, str(v))],
+                ),
+            )
+            for channel, value_type, value in rows:
+                if value_type != "empty":
+                    channel_values[channel] = self._load(value_type, value)
+        writes = self.conn.execute(
+            "SELECT task_id, channel, type, value FROM checkpoint_writes"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+            " ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={**checkpoint, "channel_values": channel_values},
+            metadata=self._load("msgpack", metadata_b),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self._load(type_, value))
+                for task_id, channel, type_, value in writes
+            ],
+        )
+
+    # ----- writes -----
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        stripped = checkpoint.copy()
+        values: dict[str, Any] = stripped.pop("channel_values")  # type: ignore[misc]
+        blobs = []
+        for channel, version in new_versions.items():
+            if channel in values:
+                type_, value = self._dump(values[channel])
+            else:
+                type_, value = "empty", None
+            blobs.append(
+                (thread_id, checkpoint_ns, channel, str(version), type_, value)
+            )
+        type_, checkpoint_b = self._dump(stripped)
+        metadata_b = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))[
+            1
+        ]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO checkpoint_blobs VALUES (?, ?, ?, ?, ?, ?)",
+                blobs,
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    configurable.get("checkpoint_id"),
+                    type_,
+                    checkpoint_b,
+                    metadata_b,
+                ),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoint_threads VALUES (?, ?)",
+                (thread_id, time.time()),
+            )
+            self._prune_thread(thread_id, checkpoint_ns)
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        configurable = config["configurable"]
+        key = (
+            configurable["thread_id"],
+            configurable.get("checkpoint_ns", ""),
+            configurable["checkpoint_id"],
+        )
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, value_b = self._dump(value)
+            rows.append(
+                (
+                    *key,
+                    task_id,
+                    WRITES_IDX_MAP.get(channel, idx),
+                    channel,
+                    type_,
+                    value_b,
+                    task_path,
+                )
+            )
+        # special writes (errors, interrupts) replace; regular writes are
+        # idempotent per (task, index), matching the in-memory saver
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        with self._lock, self.conn:
+            self.conn.executemany(
+                f"{verb} INTO checkpoint_writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock, self.conn:
+            for table in (
+                "checkpoints",
+                "checkpoint_blobs",
+                "checkpoint_writes",
+                "checkpoint_threads",
+            ):
+                self.conn.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,)
+                )
+
+    def get_next_version(self, current: str | None, channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ----- retention -----
+
+    def _prune_thread(self, thread_id: str, checkpoint_ns: str):
+        """Keep the newest `max_checkpoints`; the caller holds the lock."""
+        stale = [
+            row[0]
+            for row in self.conn.execute(
+                "SELECT checkpoint_id FROM checkpoints"
+                " WHERE thread_id = ? AND checkpoint_ns = ?"
+                " ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+                (thread_id, checkpoint_ns, self.max_checkpoints),
+            )
+        ]
+        if not stale:
+            return
+        self.conn.executemany(
+            "DELETE FROM checkpoints"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            [(thread_id, checkpoint_ns, c) for c in stale],
+        )
+        self.conn.executemany(
+            "DELETE FROM checkpoint_writes"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            [(thread_id, checkpoint_ns, c) for c in stale],
+        )
+        # drop channel values no remaining checkpoint refers to
+        referenced = set()
+        for type_, checkpoint_b in self.conn.execute(
+            "SELECT type, checkpoint FROM checkpoints"
+            " WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns),
+        ):
+            versions = self._load(type_, checkpoint_b)["channel_versions"]
+            referenced.update((k, str(v)) for k, v in versions.items())
+        blobs = self.conn.execute(
+            "SELECT channel, version FROM checkpoint_blobs"
+            " WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns),
+        ).fetchall()
+        self.conn.executemany(
+            "DELETE FROM checkpoint_blobs WHERE thread_id = ? AND checkpoint_ns = ?"
+            " AND channel = ? AND version = ?",
+            [
+                (thread_id, checkpoint_ns, channel, version)
+                for channel, version in blobs
+                if (channel, version) not in referenced
+            ],
+        )
+        metrics.increment("checkpoints.pruned", len(stale))
+
+    def compact(self) -> int:
+        """Delete idle threads and release free pages; returns threads removed."""
+        expired: list[str] = []
+        if self.idle_ttl_s is not None:
+            with self._lock:
+                expired = [
+                    row[0]
+                    for row in self.conn.execute(
+                        "SELECT thread_id FROM checkpoint_threads WHERE last_used < ?",
+                        (time.time() - self.idle_ttl_s,),
+                    )
+                ]
+        for thread_id in expired:
+            self.delete_thread(thread_id)
+        with self._lock:
+            self.conn.execute("PRAGMA incremental_vacuum")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if expired:
+            print(f"Checkpointer: expired {len(expired)} idle threads")
+            metrics.increment("checkpoints.threads_expired", len(expired))
+        return len(expired)
+
+    def _compaction_loop(self, interval_s: float):
+        while not self._stop.wait(interval_s):
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"Checkpoint compaction failed: {e}")
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            self.conn.close()
+
+    # ----- async API (SQLite calls run in a worker thread) -----
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        results = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in results:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(
+            self.put, config, checkpoint, metadata, new_versions
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
@@ -1,9 +1,177 @@
+import functools
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
 from sqlite3 import Connection as SQLiteConnection
 from model import Loan, User, UserLoan, UserLoanWithDetails
+import metrics
+import tool_cache
 
 
+# ---------------------------------------------------------------------------
+# Query instrumentation
+#
+# Every public DAL function is wrapped by `instrumented`, which records a
+# latency histogram, rows returned and the calling tool/node (see
+# `metrics.caller`). When plan capture is enabled, queries slower than
+# `slow_query_ms` are re-run under EXPLAIN QUERY PLAN and full scans flagged.
+# ---------------------------------------------------------------------------
+
+_instrumentation_config = {"slow_query_ms": 50.0, "capture_plans": False}
+_statements: ContextVar[list | None] = ContextVar("dal_statements", default=None)
+
+
+class _QueryStat:
+    def __init__(self):
+        self.latency = metrics.Histogram()
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.callers: dict[str, int] = {}
+        self.slow_queries: deque[dict] = deque(maxlen=20)
+
+
+_query_stats: dict[str, _QueryStat] = {}
+_query_stats_lock = threading.Lock()
+
+
+class _TracingCursor(sqlite3.Cursor):
+    """Cursor that remembers the statements run by the current DAL call."""
+
+    def execute(self, sql, parameters=(), /):
+        statements = _statements.get()
+        if statements is not None:
+            statements.append((sql, parameters))
+        return super().execute(sql, parameters)
+
+
+def _cursor(db_conn: SQLiteConnection) -> sqlite3.Cursor:
+    return db_conn.cursor(_TracingCursor)
+
+
+def configure_instrumentation(
+    slow_query_ms: float | None = None, capture_plans: bool | None = None
+) -> dict:
+    """Update the slow-query threshold and/or toggle plan capture."""
+    if slow_query_ms is not None:
+        _instrumentation_config["slow_query_ms"] = slow_query_ms
+    if capture_plans is not None:
+        _instrumentation_config["capture_plans"] = capture_plans
+    return dict(_instrumentation_config)
+
+
+def explain_query_plan(db_conn: SQLiteConnection, sql: str, parameters=()) -> dict:
+    """Return the EXPLAIN QUERY PLAN rows for `sql` and whether it scans a table."""
+    rows = db_conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    plan = [row[3] for row in rows]
+    return {
+        "plan": plan,
+        "full_scan": any(detail.startswith("SCAN ") for detail in plan),
+    }
+
+
+def _count_rows(result) -> int:
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    return 1
+
+
+def instrumented(func):
+    """Record timing, row counts and caller for a DAL function."""
+
+    @functools.wraps(func)
+    def wrapper(db_conn: SQLiteConnection, *args, **kwargs):
+        token = _statements.set([])
+        started = time.perf_counter()
+        failed = False
+        result = None
+        try:
+            result = func(db_conn, *args, **kwargs)
+            return result
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            statements = _statements.get() or []
+            _statements.reset(token)
+            _record_query(
+                db_conn, func.__name__, elapsed_ms, result, failed, statements
+            )
+
+    return wrapper
+
+
+def _record_query(
+    db_conn: SQLiteConnection,
+    name: str,
+    elapsed_ms: float,
+    result,
+    failed: bool,
+    statements: list,
+):
+    caller = metrics.current_caller()
+    with _query_stats_lock:
+        stat = _query_stats.setdefault(name, _QueryStat())
+        stat.calls += 1
+        stat.errors += int(failed)
+        stat.rows += _count_rows(result)
+        stat.callers[caller] = stat.callers.get(caller, 0) + 1
+    stat.latency.observe(elapsed_ms)
+
+    if elapsed_ms < _instrumentation_config["slow_query_ms"]:
+        return
+    for sql, parameters in statements:
+        entry = {
+            "query": name,
+            "caller": caller,
+            "ms": round(elapsed_ms, 2),
+            "sql": " ".join(sql.split()),
+        }
+        if _instrumentation_config["capture_plans"]:
+            try:
+                entry.update(explain_query_plan(db_conn, sql, parameters))
+            except Exception as e:
+                entry["plan_error"] = str(e)
+        with _query_stats_lock:
+            stat.slow_queries.append(entry)
+
+
+def get_query_stats() -> dict[str, dict]:
+    """Snapshot of per-function DAL statistics, keyed by function name."""
+    with _query_stats_lock:
+        items = list(_query_stats.items())
+    return {
+        name: {
+            "calls": stat.calls,
+            "errors": stat.errors,
+            "rows": stat.rows,
+            "avg_rows": stat.rows / stat.calls if stat.calls else 0.0,
+            "latency_ms": stat.latency.snapshot(),
+            "callers": dict(stat.callers),
+            "slow_queries": list(stat.slow_queries),
+        }
+        for name, stat in items
+    }
+
+
+def reset_query_stats():
+    with _query_stats_lock:
+        _query_stats.clear()
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+
+@instrumented
 def get_available_loans(db_conn: SQLiteConnection) -> list[Loan]:
-    cursor = db_conn.cursor()
+    cursor = _cursor(db_conn)
     cursor.execute("SELECT * FROM loans")
     rows = cursor.fetchall()
     loans = [
@@ -13,10 +181,11 @@ def get_available_loans(db_conn: SQLiteConnection) -> list[Loan]:
     return loans
 
 
+@instrumented
 def get_user_loans(
     db_conn: SQLiteConnection, user_id: int
 ) -> list[UserLoanWithDetails]:
-    cursor = db_conn.cursor()
+    cursor = _cursor(db_conn)
     cursor.execute(
         "SELECT * FROM user_loans INNER JOIN loans ON user_loans.loan_id = loans.loan_id WHERE user_loans.user_id = ?",
         (user_id,),
@@ -51,8 +220,9 @@ def get_user_loans(
     return user_loans
 
 
+@instrumented
 def get_specific_loan(db_conn: SQLiteConnection, loan_id: int) -> Loan | None:
-    cursor = db_conn.cursor()
+    cursor = _cursor(db_conn)
     cursor.execute("SELECT * FROM loans WHERE loan_id = ?", (loan_id,))
     row = cursor.fetchone()
     if row:
@@ -61,19 +231,22 @@ def get_specific_loan(db_conn: SQLiteConnection, loan_id: int) -> Loan | None:
     return None
 
 
+@instrumented
 def add_user_loan_record(
     db_conn: SQLiteConnection, user_id: int, loan_id: int, record: str
 ) -> None:
-    cursor = db_conn.cursor()
+    cursor = _cursor(db_conn)
     cursor.execute(
         "INSERT INTO user_loans (user_id, loan_id, applied_on, ended, record) VALUES (?, ?, DATE('now'), 0, ?)",
         (user_id, loan_id, record),
     )
     db_conn.commit()
+    tool_cache.invalidate(tool_cache.USER_LOANS_CHANGED, user=user_id)
 
 
+@instrumented
 def get_users(db_conn: SQLiteConnection) -> list[User]:
-    cursor = db_conn.cursor()
+    cursor = _cursor(db_conn)
     cursor.execute("SELECT * FROM users")
     rows = cursor.fetchall()
     users = [
@@ -83,8 +256,9 @@ def get_users(db_conn: SQLiteConnection) -> list[User]:
     return users
 
 
+@instrumented
 def get_user_by_id(db_conn: SQLiteConnection, user_id: int) -> User | None:
-    cursor = db_conn.cursor()
+    cursor = _cursor(db_conn)
     cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
     row = cursor.fetchone()
     if row:
@@ -5,9 +5,15 @@ import sqlite3
 from datetime import datetime, timedelta
 import os
 import sqlite3
+import threading
 from datetime import datetime, timedelta
+from pathlib import Path
 from typing import List, Dict, Any
 
+# Size of the memory map used by read-only connections (256 MiB). Pages inside
+# the map are read straight from the OS page cache without a copy.
+READ_MMAP_SIZE = 256 * 1024 * 1024
+
 
 def create_database(db_path: str = "loans_demo.db"):
     """Create database with the given schema"""
@@ -17,6 +23,9 @@ def create_database(db_path: str = "loans_demo.db"):
     # error when using ThreadPoolExecutor or similar.
     conn = sqlite3.connect(db_path, check_same_thread=False)
     cursor = conn.cursor()
+    # WAL lets the read-only tool connections (see ReadOnlyDB) keep reading
+    # while the eligibility agent records an application, and vice versa.
+    cursor.execute("PRAGMA journal_mode = WAL")
 
     # Create tables
     cursor.execute(
@@ -65,22 +74,29 @@ def create_database(db_path: str = "loans_demo.db"):
     """
     )
 
+    # user_loans is looked up by user on every chat turn and on the Applied
+    # Loans page; without this index each lookup scans the whole table.
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_loans_user_id ON user_loans (user_id)"
+    )
+
     conn.commit()
     return conn
 
 
+def calculate_monthly_payment(amount, interest_rate, term_months):
+    """Calculate monthly payment using amortization formula"""
+    monthly_rate = interest_rate / 100 / 12
+    if monthly_rate == 0:
+        return amount / term_months
+    payment = amount * monthly_rate * (1 + monthly_rate) ** term_months
+    payment /= (1 + monthly_rate) ** term_months - 1
+    return round(payment, 2)
+
+
 def seed_loans(cursor: sqlite3.Cursor):
     """Seed loan products with different requirements and monthly payments"""
 
-    def calculate_monthly_payment(amount, interest_rate, term_months):
-        """Calculate monthly payment using amortization formula"""
-        monthly_rate = interest_rate / 100 / 12
-        if monthly_rate == 0:
-            return amount / term_months
-        payment = amount * monthly_rate * (1 + monthly_rate) ** term_months
-        payment /= (1 + monthly_rate) ** term_months - 1
-        return round(payment, 2)
-
     loan_data = [
         # Personal Loan
         {
@@ -536,6 +552,41 @@ def seed_user_loans(cursor: sqlite3.Cursor):
     )
 
 
+class ReadOnlyDB:
+    """Per-thread read-only connections for tools that never write.
+
+    Connections are opened with a `mode=ro` URI so they can never take a
+    write lock, share one page cache (`cache=shared`) and memory-map the file.
+    Each thread gets its own connection so concurrent tool calls do not
+    serialize on a single sqlite3 handle.
+    """
+
+    def __init__(self, db_path: str, mmap_size: int = READ_MMAP_SIZE):
+        self.uri = f"{Path(db_path).resolve().as_uri()}?mode=ro&cache=shared"
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+            conn.execute("PRAGMA query_only = 1")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
 def init_db(db_path: str = "loans_demo.db"):
     db_exist = os.path.exists(db_path)
     if not db_exist:
@@ -0,0 +1,104 @@
+"""
+Deterministic eligibility rules run before the LLM eligibility agent.
+
+Clear-cut cases (credit score or income below the loan's requirement) are
+decided here in microseconds; everything else, including a high
+debt-to-income ratio, is sent to the LLM with the computed figures.
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import Literal
+
+from model import Loan, User, UserLoanWithDetails
+
+# Clear approvals skip the LLM only when enabled, because `other_requirements`
+# (down payment, enrolment, business plan...) are free text that the rules
+# cannot verify.
+AUTO_APPROVE = False
+APPROVE_MAX_DTI = 0.36
+APPROVE_CREDIT_MARGIN = 50
+APPROVE_INCOME_MULTIPLE = 1.5
+
+DecisionSource = Literal["rules", "llm"]
+
+
+@dataclass
+class PrecheckResult:
+    decision: Literal["reject", "approve", "borderline"]
+    dti: float
+    reasons: list[str] = field(default_factory=list)
+
+    def to_context(self) -> str:
+        dti = f"{self.dti:.1%}" if math.isfinite(self.dti) else "n/a (no income)"
+        lines = [
+            f"- Debt-to-income ratio including this loan: {dti}",
+            f"- Rule decision: {self.decision}",
+        ]
+        lines += [f"- {reason}" for reason in self.reasons]
+        return "\n".join(lines)
+
+
+def debt_to_income(
+    user: User, loan: Loan, user_loans: list[UserLoanWithDetails]
+) -> float:
+    """Monthly payments of active loans plus `loan`, over monthly income."""
+    monthly_income = user.income / 12
+    monthly_debt = loan.monthly_payment + sum(
+        ul.loan_details.monthly_payment for ul in user_loans if not ul.ended
+    )
+    if monthly_income <= 0:
+        return float("inf")
+    return monthly_debt / monthly_income
+
+
+def precheck(
+    user: User, loan: Loan, user_loans: list[UserLoanWithDetails]
+) -> PrecheckResult:
+    dti = debt_to_income(user, loan, user_loans)
+    reasons = []
+    if user.credit_score < loan.required_credit_score:
+        reasons.append(
+            f"Credit score {user.credit_score} is below the required minimum of {loan.required_credit_score}."
+        )
+    if user.income < loan.requirement_income:
+        reasons.append(
+            f"Annual income ${user.income:,.0f} is below the required ${loan.requirement_income:,.0f}."
+        )
+    if reasons:
+        return PrecheckResult("reject", dti, reasons)
+
+    if (
+        AUTO_APPROVE
+        and user.credit_score >= loan.required_credit_score + APPROVE_CREDIT_MARGIN
+        and user.income >= loan.requirement_income * APPROVE_INCOME_MULTIPLE
+        and dti <= APPROVE_MAX_DTI
+    ):
+        return PrecheckResult(
+            "approve",
+            dti,
+            [
+                f"Credit score {user.credit_score} meets the required {loan.required_credit_score}.",
+                f"Annual income ${user.income:,.0f} meets the required ${loan.requirement_income:,.0f}.",
+                f"Debt-to-income ratio of {dti:.0%} is within the {APPROVE_MAX_DTI:.0%} limit.",
+            ],
+        )
+    if dti > APPROVE_MAX_DTI:
+        # a policy judgement for the reviewer, not an automatic reject
+        return PrecheckResult(
+            "borderline",
+            dti,
+            [
+                (
+                    f"Debt-to-income ratio of {dti:.0%} including this loan is above {APPROVE_MAX_DTI:.0%}."
+                    if math.isfinite(dti)
+                    else "No reported income to support the monthly payments."
+                )
+            ],
+        )
+    return PrecheckResult("borderline", dti)
+
+
+def with_decision_source(record: str, source: DecisionSource) -> str:
+    """Prefix an assessment record with how the decision was made."""
+    return f"[Decision source: {source}] {record}"
@@ -0,0 +1,227 @@
+"""
+Vectorized loan math on NumPy arrays.
+
+All functions accept scalars or array-likes and broadcast them against each
+other, so a single call can price thousands of loans at once.
+"""
+
+import numpy as np
+
+# Below this monthly rate the annuity formulas lose precision to cancellation,
+# so the series expansion around r = 0 is used instead.
+_ZERO_RATE = 1e-9
+
+
+def _annuity_factor(rate: np.ndarray, n: np.ndarray) -> np.ndarray:
+    """Present value of 1 paid monthly for n months: (1 - (1 + r)^-n) / r."""
+    small = np.abs(rate) < _ZERO_RATE
+    safe_rate = np.where(small, 1.0, rate)
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        factor = (1 - (1 + safe_rate) ** -n) / safe_rate
+    return np.where(small, n - n * (n + 1) / 2 * rate, factor)
+
+
+def _annuity_factor_derivative(rate: np.ndarray, n: np.ndarray) -> np.ndarray:
+    small = np.abs(rate) < _ZERO_RATE
+    safe_rate = np.where(small, 1.0, rate)
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        growth = (1 + safe_rate) ** -n
+        derivative = (
+            n * safe_rate * growth / (1 + safe_rate) - (1 - growth)
+        ) / safe_rate**2
+    return np.where(small, -n * (n + 1) / 2, derivative)
+
+
+def monthly_payment(principal, annual_rate, term_months):
+    """Level monthly payment for `annual_rate` (percent) over `term_months`."""
+    principal, annual_rate, n = np.broadcast_arrays(
+        np.asarray(principal, dtype=float),
+        np.asarray(annual_rate, dtype=float),
+        np.asarray(term_months, dtype=float),
+    )
+    rate = annual_rate / 100 / 12
+    return principal / _annuity_factor(rate, n)
+
+
+def solve_monthly_rate(
+    principal,
+    monthly_payment,
+    term_months,
+    fee=0.0,
+    tol: float = 1e-10,
+    max_iter: int = 100,
+) -> np.ndarray:
+    """Monthly rate r with `monthly_payment * a(r, n) == principal - fee`.
+
+    Newton steps run on all elements in lockstep inside a bracket that is
+    tightened every iteration; a step that leaves the bracket (or is not
+    finite) falls back to bisection, so every element converges. Elements
+    drop out of the update once converged. Inputs with no meaningful
+    solution (non-positive net principal, payment or term) yield NaN.
+    """
+    principal, payment, n, fee = np.broadcast_arrays(
+        np.asarray(principal, dtype=float),
+        np.asarray(monthly_payment, dtype=float),
+        np.asarray(term_months, dtype=float),
+        np.asarray(fee, dtype=float),
+    )
+    shape = principal.shape
+    principal, payment, n, fee = (a.ravel() for a in (principal, payment, n, fee))
+    net = principal - fee
+    valid = (net > 0) & (payment > 0) & (n > 0)
+    net = np.where(valid, net, 1.0)
+    payment = np.where(valid, payment, 1.0)
+    n = np.where(valid, n, 1.0)
+
+    # The annuity factor is decreasing in r, so the root lies between a rate
+    # where payments are worth more than net and one where they are worth less.
+    lo = np.full(net.shape, -0.5)
+    hi = np.maximum(1.0, 2 * payment / net)
+    # Small-rate approximation of the root as the starting point.
+    rate = np.clip(2 * (payment * n - net) / (net * (n + 1)), lo, hi)
+
+    active = valid.copy()
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        r = rate[active]
+        k = n[active]
+        f = payment[active] * _annuity_factor(r, k) - net[active]
+        fprime = payment[active] * _annuity_factor_derivative(r, k)
+
+        r_lo = np.where(f > 0, r, lo[active])
+        r_hi = np.where(f < 0, r, hi[active])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = r - f / fprime
+        fallback = ~np.isfinite(step) | (step <= r_lo) | (step >= r_hi)
+        step = np.where(fallback, (r_lo + r_hi) / 2, step)
+
+        converged = (np.abs(step - r) < tol) | (f == 0)
+        lo[active] = r_lo
+        hi[active] = r_hi
+        rate[active] = step
+        active[active] = ~converged
+
+    return np.where(valid, rate, np.nan).reshape(shape)
+
+
+def solve_apr(principal, monthly_payment, term_months, fee=0.0) -> np.ndarray:
+    """Annualized rate in percent, compounding the monthly rate over 12 months.
+
+    Matches the convention of the original scalar `calc_apr`.
+    """
+    rate = solve_monthly_rate(principal, monthly_payment, term_months, fee)
+    return ((1 + rate) ** 12 - 1) * 100
+
+
+# Spreadsheet-style helpers on periodic (not annual, not percent) rates, with
+# loan-friendly signs: a loan of `pv` is repaid by positive payments `pmt`.
+
+
+def pmt(rate, nper, pv, fv=0.0):
+    """Payment per period that takes a balance of `pv` down to `fv`."""
+    rate, nper, pv, fv = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (rate, nper, pv, fv))
+    )
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        return (pv - fv * (1 + rate) ** -nper) / _annuity_factor(rate, nper)
+
+
+def pv(rate, nper, pmt, fv=0.0):
+    """Loan amount that `nper` payments of `pmt` repay down to `fv`."""
+    rate, nper, pmt, fv = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (rate, nper, pmt, fv))
+    )
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        return pmt * _annuity_factor(rate, nper) + fv * (1 + rate) ** -nper
+
+
+def fv(rate, nper, pmt, pv=0.0):
+    """Balance left on a loan of `pv` after `nper` payments of `pmt`."""
+    rate, nper, pmt, pv = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (rate, nper, pmt, pv))
+    )
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        growth = (1 + rate) ** nper
+        return pv * growth - pmt * _annuity_factor(rate, nper) * growth
+
+
+def rate(nper, pmt, pv):
+    """Periodic rate at which `nper` payments of `pmt` repay a loan of `pv`."""
+    return solve_monthly_rate(pv, pmt, nper)
+
+
+def amortization_schedule(
+    principal: float,
+    annual_rate: float,
+    term_months: int,
+    extra_payments=0.0,
+    rate_changes: dict[int, float] | None = None,
+) -> dict[str, np.ndarray]:
+    """Month-by-month schedule as NumPy arrays.
+
+    `extra_payments` is either a constant added to every payment or an array
+    of per-month extras (index 0 is month 1). `rate_changes` maps a 1-based
+    month to the new annual rate (percent) from that month on; the scheduled
+    payment is then re-amortized over the remaining term, like an ARM.
+
+    Within a constant-rate segment the balance after k payments is
+    g^k * (B0 - sum_{j<=k} payment_j / g^j) with g = 1 + r, so each segment
+    is a single cumulative sum. The schedule stops at the month the balance
+    is paid off, with the final payment reduced to exactly clear it.
+    """
+    n = int(term_months)
+    extras = np.broadcast_to(np.asarray(extra_payments, dtype=float), (n,))
+    changes = {int(m): r for m, r in (rate_changes or {}).items() if 1 <= int(m) <= n}
+    boundaries = sorted({1, n + 1, *changes})
+
+    columns: dict[str, list[np.ndarray]] = {
+        key: [] for key in ("month", "rate", "payment", "interest", "principal")
+    }
+    balances: list[np.ndarray] = []
+    balance = float(principal)
+    rate_pct = float(annual_rate)
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        rate_pct = changes.get(start, rate_pct)
+        rate = rate_pct / 100 / 12
+        months = np.arange(start, end)
+        remaining = n - start + 1
+        scheduled = balance / float(_annuity_factor(np.asarray(rate), remaining))
+
+        payments = scheduled + extras[start - 1 : end - 1]
+        growth = (1 + rate) ** np.arange(1, end - start + 1)
+        segment_balance = growth * (balance - np.cumsum(payments / growth))
+        previous = np.concatenate(([balance], segment_balance[:-1]))
+
+        # Clear cent-level rounding at the natural end of the term too.
+        paid_off = np.flatnonzero(segment_balance <= 0.005)
+        if paid_off.size:
+            stop = paid_off[0] + 1
+            months, payments = months[:stop], payments[:stop].copy()
+            previous, segment_balance = previous[:stop], segment_balance[:stop].copy()
+            payments[-1] = previous[-1] * (1 + rate)
+            segment_balance[-1] = 0.0
+
+        interest = previous * rate
+        columns["month"].append(months)
+        columns["rate"].append(np.full(months.shape, rate_pct))
+        columns["payment"].append(payments)
+        columns["interest"].append(interest)
+        columns["principal"].append(payments - interest)
+        balances.append(segment_balance)
+        balance = float(segment_balance[-1])
+        if paid_off.size:
+            break
+
+    schedule = {key: np.concatenate(parts) for key, parts in columns.items()}
+    schedule["balance"] = np.concatenate(balances)
+    return schedule
+
+
+def schedule_totals(schedule: dict[str, np.ndarray]) -> dict[str, float]:
+    """Total paid, total interest and payoff month of a schedule."""
+    return {
+        "total_paid": float(schedule["payment"].sum()),
+        "total_interest": float(schedule["interest"].sum()),
+        "payoff_month": int(schedule["month"][-1]),
+    }
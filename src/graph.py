@@ -4,18 +4,14 @@ if __name__ == "__main__":
     from rag import RAG
     from db import init_db
     from tools import get_tools
-    from agent import ReActAgent
-    import dal
+    from agent import AgentRuntime
 
     conn, _ = init_db("data/loan_assistant.db")
     rag = RAG("documents", "chroma_db")
     llm, client = get_model()
     tools = get_tools(rag, conn)
-    user = dal.get_user_by_id(conn, 1)
-    if not user:
-        raise ValueError("User with ID 1 not found.")
-    agent = ReActAgent(user, llm, client, tools, conn)
-    agent.graph.get_graph().draw_mermaid_png(
+    runtime = AgentRuntime(llm, client, tools, conn)
+    runtime.graph.get_graph().draw_mermaid_png(
         background_color="transparent",
         output_file_path="agent_graph.png",
     )
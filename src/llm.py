@@ -3,18 +3,59 @@ import os
 from dotenv import load_dotenv
 
 from ibm_watsonx_ai import APIClient
+from langchain_core.messages import BaseMessage
 from langchain_ibm import ChatWatsonx
 from watsonx import credentials, WATSONX_PROJECT_ID
+from singleflight import SingleFlight, message_payload, payload_key
 
 load_dotenv()
 
 model_id = os.getenv("WATSONX_MODEL_ID", "mistralai/mistral-medium-2505")
 
+_chat_flight = SingleFlight("llm")
+
+
+class CoalescingChatWatsonx(ChatWatsonx):
+    """ChatWatsonx that sends identical concurrent requests only once."""
+
+    def _flight_key(self, messages: list[BaseMessage], stop, kwargs) -> str:
+        return payload_key(
+            self.model_id,
+            self.params,
+            [message_payload(m) for m in messages],
+            stop,
+            kwargs,
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return _chat_flight.do(
+            self._flight_key(messages, stop, kwargs),
+            lambda: super(CoalescingChatWatsonx, self)._generate(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            ),
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await _chat_flight.ado(
+            self._flight_key(messages, stop, kwargs),
+            lambda: super(CoalescingChatWatsonx, self)._agenerate(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            ),
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        return _chat_flight.stream(
+            self._flight_key(messages, stop, kwargs),
+            lambda: super(CoalescingChatWatsonx, self)._stream(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            ),
+        )
+
 
 def get_model():
     print(f"Using model ID: {model_id}")
     client = APIClient(credentials=credentials, project_id=WATSONX_PROJECT_ID)
-    llm = ChatWatsonx(
+    llm = CoalescingChatWatsonx(
         model_id=model_id,
         watsonx_client=client,
         params={"temperature": 0.1, "max_new_tokens": 2048},
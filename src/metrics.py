@@ -0,0 +1,144 @@
+"""
+Lightweight in-process metrics shared by the DAL, tools and agent.
+
+Everything here is thread-safe and dependency-free so it can be used from
+tools running inside the graph as well as from the Streamlit UI.
+"""
+
+import bisect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds (in milliseconds) of the latency histogram buckets.
+LATENCY_BUCKETS_MS = (
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    25,
+    50,
+    100,
+    250,
+    500,
+    1000,
+    2500,
+    5000,
+    10000,
+    30000,
+)
+
+# Upper bounds of the prompt-size histogram buckets, in tokens.
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 6000, 8000, 12000, 16000, 32000, 64000)
+
+
+class Histogram:
+    """Fixed-bucket histogram with approximate percentiles."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, q: float) -> float:
+        """Return the upper bound of the bucket holding the q-th percentile."""
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            target = q * self.count
+            seen = 0
+            for index, n in enumerate(self.counts):
+                seen += n
+                if seen >= target and n:
+                    if index == len(self.buckets):
+                        return self.max
+                    return min(self.buckets[index], self.max)
+            return self.max
+
+    def snapshot(self) -> dict:
+        mean = self.total / self.count if self.count else 0.0
+        labels = [f"<={b:g}" for b in self.buckets] + ["+Inf"]
+        return {
+            "count": self.count,
+            "mean": mean,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+            "buckets": {label: n for label, n in zip(labels, self.counts) if n},
+        }
+
+
+# Process-wide named metrics, e.g. `metrics.increment("tool_timeouts")` or
+# `metrics.histogram("turn_latency_ms").observe(...)`.
+_histograms: dict[str, Histogram] = {}
+_counters: dict[str, float] = {}
+_registry_lock = threading.Lock()
+
+
+def histogram(name: str, buckets: tuple[float, ...] = LATENCY_BUCKETS_MS) -> Histogram:
+    """Return the histogram `name`; `buckets` only applies on first use."""
+    with _registry_lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(buckets)
+        return _histograms[name]
+
+
+def increment(name: str, amount: float = 1):
+    with _registry_lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def counter(name: str) -> float:
+    with _registry_lock:
+        return _counters.get(name, 0)
+
+
+def snapshot() -> dict:
+    """All counters and histogram summaries, for the debug panel or logs."""
+    with _registry_lock:
+        counters = dict(_counters)
+        histograms = dict(_histograms)
+    return {
+        "counters": counters,
+        "histograms": {name: h.snapshot() for name, h in histograms.items()},
+    }
+
+
+def reset():
+    with _registry_lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+_caller: ContextVar[str] = ContextVar("metrics_caller", default="unknown")
+
+
+def current_caller() -> str:
+    """Name of the tool, graph node or page currently doing work."""
+    return _caller.get()
+
+
+@contextmanager
+def caller(name: str):
+    """Attribute work done inside the block (e.g. DAL queries) to `name`."""
+    token = _caller.set(name)
+    try:
+        yield
+    finally:
+        _caller.reset(token)
@@ -0,0 +1,344 @@
+"""
+Content moderation helpers for the guardian node.
+
+One `Guardian` is shared per API client for the whole process, and verdicts
+are cached by a hash of the normalized message plus the detector
+configuration, so repeated or retried inputs skip the remote round-trip.
+
+Before that, `LocalModerator` scores each message with regex and PII patterns
+(plus an optional local classifier). It accepts a message locally only when
+every word is known benign loan-domain vocabulary (after NFKC folding, in
+any script) and it has no emoji or other non-ASCII symbols; everything else
+is escalated to the remote detectors.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Literal
+
+from ibm_watsonx_ai import APIClient
+from ibm_watsonx_ai.foundation_models.moderations import Guardian
+
+import metrics
+
+Verdict = Literal["inappropriate", "safe"]
+
+GUARDIAN_DETECTORS = {
+    "hap": {},
+    "granite_guardian": {"risk_name": "harm", "threshold": 0.6},
+    "topic_relevance": {"threshold": 0.5},
+    "pii": {},
+}
+
+_guardians: dict[int, Guardian] = {}
+_guardians_lock = threading.Lock()
+
+
+def get_guardian(client: APIClient, detectors: dict = GUARDIAN_DETECTORS) -> Guardian:
+    """Return the process-wide Guardian for `client`, creating it once."""
+    with _guardians_lock:
+        guardian = _guardians.get(id(client))
+        if guardian is None:
+            guardian = Guardian(api_client=client, detectors=detectors)
+            _guardians[id(client)] = guardian
+        return guardian
+
+
+def normalize_message(text: str) -> str:
+    # NFKC folds full-width and other compatibility forms to their plain
+    # letters, so the patterns below see "ｆｕｃｋ" as "fuck"
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+class VerdictCache:
+    """Bounded TTL cache of moderation verdicts.
+
+    Only hashes are stored, never the message text itself.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl_s: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: OrderedDict[str, tuple[Verdict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str, detectors: dict) -> str:
+        payload = json.dumps(
+            [normalize_message(text), detectors], sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, text: str, detectors: dict) -> Verdict | None:
+        key = self.key(text, detectors)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                metrics.increment("moderation.cache_hits")
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+        metrics.increment("moderation.cache_misses")
+        return None
+
+    def put(self, text: str, detectors: dict, verdict: Verdict):
+        key = self.key(text, detectors)
+        with self._lock:
+            self._entries[key] = (verdict, time.monotonic() + self.ttl_s)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+VERDICT_CACHE = VerdictCache()
+
+
+def guardian_verdict(guardian: Guardian, text: str, detectors: dict) -> Verdict:
+    """Run the remote detectors on `text`."""
+    started = time.perf_counter()
+    response = guardian.detect(text=text, detectors=detectors)  # type: ignore
+    metrics.histogram("moderation.remote_ms").observe(
+        (time.perf_counter() - started) * 1000
+    )
+    if (
+        len(response["detections"]) != 0
+        and response["detections"][0]["detection"] == "Yes"
+    ):
+        return "inappropriate"
+    return "safe"
+
+
+# ----- Local first tier -----
+
+# Requests that are inappropriate regardless of context.
+BLOCK_PATTERNS = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        r"\b(make|build|buy)\b.{0,30}\b(bomb|explosives?|weapons?|guns?)\b",
+        r"\b(kill|murder|hurt|kidnap)\b.{0,30}\b(him|her|them|you|someone|people)\b",
+        r"\b(launder(ing)?|money mule|fake (id|identity|pay ?stubs?)|forge[ds]?)\b",
+        r"\b(steal|stolen)\b.{0,30}\b(identity|credit cards?|ssn|accounts?)\b",
+        r"\b(ignore|disregard)\b.{0,30}\b(previous|above|system)\b.{0,20}\b(instructions|prompt)\b",
+    )
+]
+
+# Wording that may or may not be harmful; the remote detectors decide.
+RISK_PATTERNS = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        r"\b(kill|die|dead|suicide|attack|threat|hate|stupid|idiot|damn|hell)\b",
+        r"\b(hack|exploit|bypass|jailbreak|password)\b",
+        r"\b(drugs?|gambl(e|ing)|casino|bet(ting)?)\b",
+        # profanity and abuse
+        r"(f+u+c+k+|sh[i1]t+|bitch|bastard|cunt|dick|pussy|asshole|\bass\b|wtf|stfu)",
+        r"\b(worthless|useless|pathetic|moron|retard(ed)?|dumb|loser|scum|trash|garbage|shut up)\b",
+        # drugs, weapons and violence
+        r"\b(cocaine|heroin|meth|fentanyl|weed|marijuana|cannabis|crack|opioids?|pills)\b",
+        r"\b(guns?|firearms?|weapons?|ammo|ammunition|knife|bomb|explosives?|shoot|stab|beat|revenge)\b",
+    )
+]
+
+# Personal data the remote `pii` detector would flag.
+SSN_PATTERN = re.compile(r"\b\d{3}-\d{2}-\d{4}\b")
+CARD_PATTERN = re.compile(r"\b(?:\d[ -]?){13,19}\b")
+SOFT_PII_PATTERNS = [
+    re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.-]+\b"),  # email
+    re.compile(r"(?:\+?\d{1,2}[ .-]?)?\(?\d{3}\)?[ .-]\d{3}[ .-]\d{4}\b"),  # phone
+]
+
+# Words that mark a message as on-topic for the `topic_relevance` detector.
+DOMAIN_TERMS = frozenset(
+    """
+    loan loans apply applied application applications eligible eligibility
+    approve approved approval rate rates interest apr payment payments monthly
+    mortgage credit score income debt borrow borrowing lend lender refinance
+    term terms principal amortization schedule compare comparison repay
+    repayment installment afford affordable student personal auto car home
+    business balance fee fees requirement requirements qualify collateral
+    down emi calculate calculation total cost years months
+    """.split()
+)
+GREETINGS = frozenset(
+    "hi hello hey thanks thank you ok okay yes no bye goodbye help please".split()
+)
+# Everyday words that carry no risk on their own. A message is accepted
+# locally only if all of its words are in this set, DOMAIN_TERMS or GREETINGS.
+BENIGN_WORDS = frozenset(
+    """
+    a an the i me my mine we our you your it its this that these those there
+    what whats which who how when where why is are was were be been am do does
+    did can could would should will shall may might must have has had get got
+    to of for in on at by with from about as and or but if than then so not
+    any some all each more most less least much many few other another same
+    s t d ll m re ve id im
+    want need like know tell explain show give list find check see help
+    understand mean means meaning difference between vs versus per over under
+    best good better cheapest lowest highest lower higher low high new current
+    available options option type types kind kinds example examples info
+    information details detail question questions work works way ways
+    pay paid paying take taking get getting make making start started
+    year yearly month day days week weeks percent percentage dollars dollar
+    amount amounts number numbers one two three four five six ten
+    early late extra fixed variable change changes plan plans max minimum
+    maximum limit much long short
+    """.split()
+)
+
+MAX_LOCAL_LENGTH = 500
+
+# letters of any script, so words outside the vocabulary are never invisible
+_WORD = re.compile(r"[^\W\d_]+")
+
+
+def _unknown_symbols(text: str) -> bool:
+    """True if the text has non-ASCII characters other than letters (emoji,
+    pictographs, exotic punctuation), which the vocabulary cannot vouch for."""
+    return any(
+        not ch.isascii() and not unicodedata.category(ch).startswith("L") for ch in text
+    )
+
+
+def _luhn_valid(digits: str) -> bool:
+    total = 0
+    for i, ch in enumerate(reversed(digits)):
+        n = int(ch)
+        if i % 2 == 1:
+            n = n * 2 - 9 if n > 4 else n * 2
+        total += n
+    return total % 10 == 0
+
+
+@dataclass
+class LocalVerdict:
+    # estimated probability that the remote detectors would flag the message
+    score: float
+    verdict: Verdict | None  # None means "escalate"
+    reasons: list[str] = field(default_factory=list)
+
+
+class LocalModerator:
+    """Cheap first tier in front of the remote Guardian.
+
+    Messages scoring at or below `safe_below` are accepted and at or above
+    `block_above` are blocked locally; everything in between is escalated.
+    `classifier`, if given, returns the probability that a text is
+    inappropriate and is combined with the pattern score by taking the max.
+    """
+
+    def __init__(
+        self,
+        safe_below: float = 0.2,
+        block_above: float = 0.9,
+        classifier: Callable[[str], float] | None = None,
+    ):
+        if not 0 <= safe_below < block_above <= 1:
+            raise ValueError("expected 0 <= safe_below < block_above <= 1")
+        self.safe_below = safe_below
+        self.block_above = block_above
+        self.classifier = classifier
+
+    def score(self, text: str) -> tuple[float, list[str]]:
+        for pattern in BLOCK_PATTERNS:
+            if pattern.search(text):
+                return 1.0, ["blocked pattern"]
+        if SSN_PATTERN.search(text):
+            return 1.0, ["social security number"]
+        for match in CARD_PATTERN.finditer(text):
+            digits = re.sub(r"\D", "", match.group())
+            if 13 <= len(digits) <= 19 and _luhn_valid(digits):
+                return 1.0, ["card number"]
+
+        # safe only on positive evidence: a short message made up entirely
+        # of known benign words, at least one of them on-topic
+        score, reasons = 0.05, []
+        if len(text) > MAX_LOCAL_LENGTH:
+            score, reasons = 0.5, reasons + ["long message"]
+        if any(pattern.search(text) for pattern in RISK_PATTERNS):
+            score, reasons = 0.5, reasons + ["risky wording"]
+        if any(pattern.search(text) for pattern in SOFT_PII_PATTERNS):
+            score, reasons = 0.5, reasons + ["contact details"]
+        words = set(_WORD.findall(text.casefold()))
+        if not words or not (DOMAIN_TERMS.intersection(words) or words <= GREETINGS):
+            score, reasons = max(score, 0.5), reasons + ["off-topic"]
+        unknown = words - DOMAIN_TERMS - GREETINGS - BENIGN_WORDS
+        if unknown:
+            score, reasons = max(score, 0.5), reasons + ["unrecognized words"]
+        if _unknown_symbols(text):
+            score, reasons = max(score, 0.5), reasons + ["unrecognized symbols"]
+
+        if self.classifier is not None:
+            score = max(score, float(self.classifier(text)))
+        return score, reasons
+
+    def check(self, text: str) -> LocalVerdict:
+        score, reasons = self.score(normalize_message(text))
+        verdict: Verdict | None = None
+        if score <= self.safe_below:
+            verdict = "safe"
+        elif score >= self.block_above:
+            verdict = "inappropriate"
+        metrics.increment("moderation.checked")
+        metrics.increment(f"moderation.local.{verdict or 'escalated'}")
+        return LocalVerdict(score, verdict, reasons)
+
+
+def escalation_rate() -> float:
+    """Share of moderated messages sent to the remote detectors."""
+    checked = metrics.counter("moderation.checked")
+    if not checked:
+        return 0.0
+    return metrics.counter("moderation.local.escalated") / checked
+
+
+def load_classifier(model_name: str) -> Callable[[str], float]:
+    """Build a local text-classification scorer (requires `transformers`).
+
+    Returns the total probability of the labels that are not a known benign
+    label such as "safe", "neutral" or "LABEL_0".
+    """
+    try:
+        from transformers import pipeline
+    except ImportError as e:
+        raise ImportError(
+            "the local moderation classifier requires `pip install transformers`"
+        ) from e
+    classify = pipeline("text-classification", model=model_name, top_k=None)
+    safe_labels = {"safe", "neutral", "non-toxic", "not_toxic", "label_0", "ok"}
+
+    def score(text: str) -> float:
+        labels = classify(text[:2000], truncation=True)
+        if labels and isinstance(labels[0], list):
+            labels = labels[0]
+        return sum(
+            item["score"]
+            for item in labels
+            if str(item["label"]).casefold() not in safe_labels
+        )
+
+    return score
+
+
+if __name__ == "__main__":
+    # regression checks for the local tier: these must never be accepted
+    moderator = LocalModerator()
+    for text in [
+        "fuck this loan",
+        "loan убью тебя",  # Cyrillic threat
+        "loan 💣💣",
+        "loan ｆｕｃｋ ｙｏｕ",  # full-width letters
+        "loan ﾊﾞｶ",  # half-width katakana
+        "what is the loan interest rate ✅",
+    ]:
+        result = moderator.check(text)
+        assert result.verdict != "safe", (text, result)
+        print(f"{text!r}: {result.verdict or 'escalated'} {result.reasons}")
+    for text in ["What is the interest rate on a personal loan?", "hello"]:
+        assert moderator.check(text).verdict == "safe", text
+    print("Local moderation checks passed.")
@@ -10,7 +10,8 @@ from model import (
     eligibility_agent_output_success_example,
     user_loan_list_to_context,
 )
-from typing import List
+from eligibility import PrecheckResult
+from typing import List, Optional
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import (
     HumanMessage,
@@ -24,9 +25,7 @@ from langchain_core.messages import (
 BASE_ADVISOR_PROMPT = """**SYSTEM PROMPT FOR LOANGUIDE ASSISTANT**
 
 You are 'LoanGuide', a specialized loan advisory assistant with integrated tools. Your purpose is to provide accurate loan information, calculations, and advisory services while strictly adhering to tool-based data retrieval and calculations.
-
-**USER PROFILE:**
-{user_profile}
+The current user's profile follows these instructions.
 
 **AVAILABLE TOOLS:**
 - retrieve_loan_knowledge: For loan concept explanations using RAG
@@ -35,8 +34,11 @@ You are 'LoanGuide', a specialized loan advisory assistant with integrated tools
 - get_specific_loan: Get details of specific loan from database
 - calculate_Annual_Percentage_Rate: APR calculations for SINGLE loans
 - multiple_apr_calculator: APR calculations for MULTIPLE loans
+- amortization_schedule: Month-by-month breakdowns, total interest, payoff month, extra payments and rate changes in ONE call
+- compare_loans: Rank loan products across terms, amounts and rate scenarios (payment, APR, total cost) in ONE call
 - general_calculation_tool: General math (monthly payments, interest, etc.) for SINGLE loans
 - batch_general_calculation_tool: BATCH calculations for MULTIPLE loans
+- fetch_tool_output: Full text of an earlier tool result shown as "[Compacted output ...]", by its ref
 
 **CONCISE REASONING REQUIRED:** 
 During thinking steps, use only 1-5 brief sentences. Do NOT plan entire response. ALWAYS leave room for final answer.
@@ -60,6 +62,8 @@ During thinking steps, use only 1-5 brief sentences. Do NOT plan entire response
 3. **CALCULATION LOGIC (TOOLS REQUIRED):**
    - Single APR: calculate_Annual_Percentage_Rate
    - Multiple APR: multiple_apr_calculator
+   - Payment schedules, total interest, payoff dates, extra payments: amortization_schedule
+   - Comparing loans, terms or amounts ("which is cheapest over 3 vs 5 years"): compare_loans
    - Single general: general_calculation_tool
    - Multiple general: batch_general_calculation_tool
    - NEVER perform manual calculations
@@ -129,16 +133,93 @@ Only stop generating when you have produced complete, valid JSON in this exact f
 """
 
 
-def generate_base_prompt(user: User, messages: List[AnyMessage]) -> List[AnyMessage]:
-    user_profile = user.to_context()
-    sys_prompt = BASE_ADVISOR_PROMPT.format(
-        user_profile=user_profile,
+USER_PROFILE_PROMPT = """**USER PROFILE:**
+{user_profile}"""
+
+# The static instructions are rendered once and always sent first, so the
+# longest part of the prompt is byte-identical across users and turns and a
+# server-side prefix cache can reuse it. Per-user and per-thread parts follow.
+BASE_ADVISOR_SYSTEM_MESSAGE = SystemMessage(
+    BASE_ADVISOR_PROMPT.format(
         schema=BaseAgentOutputSchema.model_json_schema(),
         example_normal=base_agent_output_res_example,
         example_apply=base_agent_output_apply_example,
     )
+)
+
+# user_id -> (profile version, rendered profile message)
+_profile_messages: dict[int, tuple[tuple, SystemMessage]] = {}
+
+
+def user_profile_message(user: User) -> SystemMessage:
+    """The user's profile message, re-rendered only when the profile changes."""
+    version = tuple(user.model_dump().values())
+    cached = _profile_messages.get(user.user_id)
+    if cached is None or cached[0] != version:
+        message = SystemMessage(
+            USER_PROFILE_PROMPT.format(user_profile=user.to_context())
+        )
+        cached = _profile_messages[user.user_id] = (version, message)
+    return cached[1]
+
+
+def generate_base_prompt(
+    user: Optional[User], messages: List[AnyMessage], summary: str = ""
+) -> List[AnyMessage]:
+    """Base advisor prompt; without a user it has no profile, for answers
+    shared between users."""
+    prompt: List[AnyMessage] = [BASE_ADVISOR_SYSTEM_MESSAGE]
+    if user is not None:
+        prompt.append(user_profile_message(user))
+    if summary:
+        prompt.append(SystemMessage(CONVERSATION_SUMMARY.format(summary=summary)))
+    return prompt + messages
+
+
+CONVERSATION_SUMMARY = """**SUMMARY OF EARLIER CONVERSATION:**
+{summary}"""
+
+SUMMARIZER_PROMPT = """You maintain a running summary of a conversation between a user and 'LoanGuide', a loan advisory assistant.
 
-    return [SystemMessage(sys_prompt)] + messages
+Update the existing summary with the new conversation excerpt. Keep:
+- The user's goals, preferences and constraints (amounts, terms, budgets)
+- Loan IDs, products, figures and calculation results that were discussed
+- Applications made and their outcomes
+- Open questions or follow-ups
+
+Drop greetings, tool mechanics and repeated information. Write concise bullet points, at most {max_words} words in total. Output only the summary.
+
+**EXISTING SUMMARY:**
+{summary}
+
+**NEW CONVERSATION EXCERPT:**
+{transcript}"""
+
+# Appended to the last LLM call of a turn whose tool or time budget ran out.
+FORCE_FINAL_ANSWER = """[System notice] The tool budget for this turn is used up and no more tools can be called. Give your final answer now, in the required JSON format, using only the information above. If something could not be looked up, say so briefly."""
+
+# Longest excerpt of a single message included in the summarizer transcript.
+SUMMARY_MESSAGE_CHARS = 1500
+
+
+def generate_summary_prompt(
+    summary: str, messages: List[AnyMessage], max_words: int = 300
+) -> List[AnyMessage]:
+    lines = []
+    for message in messages:
+        content = str(message.content)[:SUMMARY_MESSAGE_CHARS]
+        if isinstance(message, HumanMessage):
+            lines.append(f"User: {content}")
+        elif isinstance(message, ToolMessage):
+            lines.append(f"Tool result ({message.name}): {content}")
+        elif isinstance(message, AIMessage) and content:
+            lines.append(f"Assistant: {content}")
+    prompt = SUMMARIZER_PROMPT.format(
+        max_words=max_words,
+        summary=summary or "(none yet)",
+        transcript="\n".join(lines),
+    )
+    return [HumanMessage(prompt)]
 
 
 # 3. LOAN_KNOWLEDGE_BASE - Retrieved via RAG tool
@@ -161,6 +242,9 @@ Loan Application:
 User Loans
 {user_loans}
 
+Automated Precheck (deterministic rules, already verified):
+{precheck}
+
 PROHIBITED ACCESS - NEVER:
 - Query other user data
 - Access other loan products
@@ -201,14 +285,21 @@ Example output for NOT ELIGIBLE application:
 """
 
 
+ELIGIBILITY_OUTPUT_SCHEMA = EligibilityAgentOutputSchema.model_json_schema()
+
+
 def generate_eligibility_prompt(
-    user: User, loan: Loan, user_loans: list[UserLoanWithDetails]
+    user: User,
+    loan: Loan,
+    user_loans: list[UserLoanWithDetails],
+    precheck: PrecheckResult | None = None,
 ) -> List[AnyMessage]:
     prompt = ELIGIBILITY_AGENT_PROMPT.format(
         user_profile=user.to_context(),
         loan_to_apply=loan.to_context(),
         user_loans=user_loan_list_to_context(user_loans),
-        schema=EligibilityAgentOutputSchema.model_json_schema(),
+        precheck=precheck.to_context() if precheck else "Not available.",
+        schema=ELIGIBILITY_OUTPUT_SCHEMA,
         example_success=eligibility_agent_output_success_example,
         example_reject=eligibility_agent_output_reject_example,
     )
@@ -11,12 +11,40 @@ from ibm_watsonx_ai.metanames import EmbedTextParamsMetaNames as EmbedParams
 from typing import List, Optional
 import glob
 import shutil
+import tool_cache
+from singleflight import SingleFlight, payload_key
 
 
 embed_params = {
     EmbedParams.RETURN_OPTIONS: {"input_text": True},
 }
 
+# vectors are never mutated by callers, so they are shared without copying
+_embed_flight = SingleFlight("embeddings", copy_results=False)
+
+
+class CoalescingWatsonxEmbeddings(WatsonxEmbeddings):
+    """WatsonxEmbeddings that embeds identical concurrent inputs only once."""
+
+    def _flight_key(self, kind: str, texts: list[str]) -> str:
+        return payload_key(kind, self.model_id, [" ".join(t.split()) for t in texts])
+
+    def embed_documents(self, texts: list[str], **kwargs) -> list[list[float]]:
+        return _embed_flight.do(
+            self._flight_key("documents", texts),
+            lambda: super(CoalescingWatsonxEmbeddings, self).embed_documents(
+                texts, **kwargs
+            ),
+        )
+
+    def embed_query(self, text: str, **kwargs) -> list[float]:
+        return _embed_flight.do(
+            self._flight_key("query", [text]),
+            lambda: super(CoalescingWatsonxEmbeddings, self).embed_query(
+                text, **kwargs
+            ),
+        )
+
 
 class RAG:
 
@@ -37,7 +65,7 @@ class RAG:
     def _initialize_rag_system(self, force_recreate: bool = False):
         """Initialize the RAG system with persistence"""
         # Initialize embeddings
-        self.embeddings = WatsonxEmbeddings(
+        self.embeddings = CoalescingWatsonxEmbeddings(
             model_id="ibm/slate-30m-english-rtrvr-v2",
             url=credentials.get("url"),
             project_id=WATSONX_PROJECT_ID,
@@ -103,6 +131,7 @@ class RAG:
             embedding=self.embeddings,
             persist_directory=self.persist_directory,
         )
+        tool_cache.invalidate(tool_cache.KNOWLEDGE_CHANGED)
         print(f"Created new vector store and persisted to {self.persist_directory}")
 
     def _load_documents(self) -> List[Document]:
@@ -196,6 +225,7 @@ class RAG:
 
             # Add to vector store
             self.vector_store.add_documents(splits)
+            tool_cache.invalidate(tool_cache.KNOWLEDGE_CHANGED)
             print(f"Added document: {filename} ({len(splits)} chunks)")
 
         except Exception as e:
@@ -205,6 +235,7 @@ class RAG:
         """Delete the entire vector store collection"""
         if self.vector_store:
             self.vector_store.delete_collection()
+            tool_cache.invalidate(tool_cache.KNOWLEDGE_CHANGED)
             print("Vector store collection deleted.")
 
     def get_collection_info(self):
@@ -0,0 +1,172 @@
+"""
+Response cache for user-independent knowledge questions.
+
+"What is a personal loan?" gets the same answer for every user, so when the
+first turn of a thread was answered from the knowledge base alone, an answer
+generated without the user's profile is stored here (see
+`AgentRuntime._remember_response`), keyed by the normalized question. Later
+first-turn askers are served from the cache without LLM or RAG calls.
+Questions that are worded differently fall back to embedding similarity when
+an embedding function is configured; such hits still need a Guardian verdict.
+
+Entries are dropped whenever the knowledge index changes
+(`tool_cache.KNOWLEDGE_CHANGED`).
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import numpy as np
+
+import metrics
+import tool_cache
+
+# Cosine similarity above which a differently worded question counts as the
+# same question.
+DEFAULT_SIMILARITY = 0.95
+# Questions shorter than this (in words) are too ambiguous to share answers.
+MIN_QUESTION_WORDS = 3
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize(question: str) -> str:
+    return " ".join(_PUNCTUATION.sub(" ", question.lower()).split())
+
+
+@dataclass
+class _Entry:
+    answer: str
+    created_at: float
+    vector: np.ndarray | None
+
+
+class ResponseCache:
+    """Bounded LRU of answers by normalized question, with a semantic fallback."""
+
+    def __init__(
+        self,
+        embed: Callable[[str], list[float]] | None = None,
+        similarity: float = DEFAULT_SIMILARITY,
+        max_entries: int = 1024,
+        ttl_s: float | None = 24 * 3600,
+    ):
+        self.embed = embed
+        self.similarity = similarity
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        # embeddings of recent lookups, reused when their answer is stored
+        self._vectors: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._matrix: tuple[list[str], np.ndarray] | None = None
+        self._lock = threading.Lock()
+        tool_cache.subscribe(tool_cache.KNOWLEDGE_CHANGED, self.clear)
+
+    def get(self, question: str) -> tuple[str, str] | None:
+        """Return (answer, "exact" | "semantic") or None."""
+        key = normalize(question)
+        if len(key.split()) < MIN_QUESTION_WORDS:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._drop(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                metrics.increment("response_cache.hits.exact")
+                return entry.answer, "exact"
+            has_vectors = any(e.vector is not None for e in self._entries.values())
+        if self.embed is None or not has_vectors:
+            metrics.increment("response_cache.misses")
+            return None
+
+        vector = self._embed(key)
+        if vector is None:
+            metrics.increment("response_cache.misses")
+            return None
+        with self._lock:
+            match = self._nearest(vector, now)
+            if match is not None:
+                self._entries.move_to_end(match)
+                metrics.increment("response_cache.hits.semantic")
+                return self._entries[match].answer, "semantic"
+        metrics.increment("response_cache.misses")
+        return None
+
+    def put(self, question: str, answer: str):
+        key = normalize(question)
+        if len(key.split()) < MIN_QUESTION_WORDS:
+            return
+        with self._lock:
+            vector = self._vectors.pop(key, None)
+        if vector is None and self.embed is not None:
+            vector = self._embed(key)
+            with self._lock:
+                self._vectors.pop(key, None)
+        with self._lock:
+            self._entries[key] = _Entry(answer, time.time(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+        metrics.increment("response_cache.stored")
+
+    def clear(self):
+        with self._lock:
+            dropped = len(self._entries)
+            self._entries.clear()
+            self._vectors.clear()
+            self._matrix = None
+        if dropped:
+            print(f"Response cache: dropped {dropped} answers")
+            metrics.increment("response_cache.invalidated", dropped)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl_s is not None and now - entry.created_at > self.ttl_s
+
+    def _drop(self, key: str):
+        del self._entries[key]
+        self._matrix = None
+
+    def _embed(self, key: str) -> np.ndarray | None:
+        try:
+            vector = np.asarray(self.embed(key), dtype=np.float32)  # type: ignore
+        except Exception as e:
+            print(f"Response cache: embedding failed: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        vector /= norm
+        with self._lock:
+            self._vectors[key] = vector
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+        return vector
+
+    def _nearest(self, vector: np.ndarray, now: float) -> str | None:
+        """Most similar live entry above the threshold; the caller holds the lock."""
+        if self._matrix is None:
+            keys = [k for k, e in self._entries.items() if e.vector is not None]
+            if not keys:
+                return None
+            self._matrix = (keys, np.stack([self._entries[k].vector for k in keys]))  # type: ignore
+        keys, matrix = self._matrix
+        scores = matrix @ vector
+        for i in np.argsort(scores)[::-1]:
+            if scores[i] < self.similarity:
+                return None
+            entry = self._entries.get(keys[i])
+            if entry is not None and not self._expired(entry, now):
+                return keys[i]
+        return None
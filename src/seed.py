@@ -0,0 +1,332 @@
+"""
+Bulk-generate synthetic loan products, users and applications.
+
+The demo seed in `db.py` only creates a handful of rows, which says nothing
+about how the DAL behaves at production scale. This CLI fills a database with
+millions of realistic-looking rows so `dal.get_user_loans`, the Applied Loans
+page and the DB tools can be benchmarked at realistic sizes.
+
+Usage:
+    python src/seed.py data/loan_assistant_bench.db \\
+        --users 1000000 --loans 5000 --applications 3000000
+
+Point the app at the generated file with `LOAN_ASSISTANT_DB`.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Iterator
+
+from db import (
+    calculate_monthly_payment,
+    create_database,
+    seed_loans,
+    seed_users,
+    seed_user_loans,
+)
+
+# Pragmas tuned for a one-off bulk load: no rollback journal, no fsync and a
+# large page cache. A crash mid-load corrupts the file, which is acceptable
+# for a throwaway benchmark database.
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA locking_mode = EXCLUSIVE",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",  # 256 MiB
+]
+
+LOAN_TYPES = {
+    # type: (min amount, max amount, terms, base rate, min credit score)
+    "Personal": (2000, 50000, [12, 24, 36, 48, 60], 7.5, 620),
+    "Mortgage": (80000, 1200000, [180, 240, 360], 4.5, 660),
+    "Auto": (5000, 90000, [36, 48, 60, 72, 84], 5.5, 580),
+    "Small Business": (10000, 500000, [24, 36, 48, 60, 120], 7.0, 680),
+    "Student": (2000, 120000, [60, 120, 180, 240], 4.0, 550),
+    "Emergency Medical": (1000, 40000, [12, 24, 36], 8.5, 580),
+    "Home Improvement": (5000, 150000, [36, 60, 84, 120], 6.0, 640),
+    "Debt Consolidation": (5000, 100000, [24, 36, 48, 60], 7.0, 640),
+}
+
+LOAN_REQUIREMENTS = [
+    "Minimum 2 years of employment history",
+    "Proof of income required",
+    "Collateral may be required",
+    "Co-signer accepted for thin credit files",
+    "No bankruptcies in the last 7 years",
+    "Homeowner required, contractor estimate needed",
+    "Business plan required, minimum 2 years in business",
+    "Vehicle must be less than 10 years old",
+]
+
+JOB_TITLES = [
+    ("Software Engineer", 95000),
+    ("Registered Nurse", 72000),
+    ("Teacher", 52000),
+    ("Accountant", 68000),
+    ("Sales Associate", 34000),
+    ("Marketing Manager", 70000),
+    ("Electrician", 58000),
+    ("Graduate Student", 18000),
+    ("Retail Manager", 46000),
+    ("Small Business Owner", 85000),
+    ("Physician", 210000),
+    ("Rideshare Driver", 31000),
+    ("Retired", 40000),
+    ("Unemployed", 0),
+]
+
+HOUSING = [
+    "Renting apartment",
+    "Owns home with mortgage",
+    "Owns home outright",
+    "Living with family",
+]
+
+RECORD_APPROVED = [
+    "{type} loan approved. Credit score {score} meets requirement. Income verified.",
+    "{type} loan approved after document review. Employment history verified.",
+    "{type} loan approved. Debt-to-income ratio within policy limits.",
+]
+
+RECORD_ENDED = [
+    "{type} loan fully repaid. No late payments recorded.",
+    "{type} loan closed early with prepayment.",
+]
+
+
+def _next_id(cursor: sqlite3.Cursor, table: str, column: str) -> int:
+    cursor.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}")
+    return cursor.fetchone()[0] + 1
+
+
+def generate_loans(rng: random.Random, start_id: int, count: int) -> Iterator[tuple]:
+    """Yield loan product rows in `loans` column order."""
+    types = list(LOAN_TYPES)
+    for loan_id in range(start_id, start_id + count):
+        loan_type = rng.choice(types)
+        low, high, terms, base_rate, min_score = LOAN_TYPES[loan_type]
+        amount = float(round(rng.uniform(low, high), -2))
+        term_months = rng.choice(terms)
+        interest_rate = round(max(0.5, rng.gauss(base_rate, 1.5)), 2)
+        fee = round(amount * rng.uniform(0.0, 0.02), 2)
+        required_credit_score = min(800, min_score + rng.randrange(0, 100, 10))
+        requirement_income = float(round(amount * rng.uniform(0.3, 1.2), -3))
+        yield (
+            loan_id,
+            loan_type,
+            amount,
+            calculate_monthly_payment(amount, interest_rate, term_months),
+            interest_rate,
+            term_months,
+            fee,
+            f"{loan_type} loan product #{loan_id}",
+            required_credit_score,
+            requirement_income,
+            rng.choice(LOAN_REQUIREMENTS),
+        )
+
+
+def generate_users(rng: random.Random, start_id: int, count: int) -> Iterator[tuple]:
+    """Yield user rows in `users` column order."""
+    for user_id in range(start_id, start_id + count):
+        job_title, median_income = rng.choice(JOB_TITLES)
+        income = (
+            float(round(median_income * rng.lognormvariate(0, 0.3), -2))
+            if median_income
+            else 0.0
+        )
+        credit_score = int(min(850, max(300, rng.gauss(690, 70))))
+        years = rng.randint(0, 30)
+        yield (
+            user_id,
+            f"user{user_id}@example.com",
+            credit_score,
+            income,
+            job_title,
+            f"{job_title} for {years} years. {rng.choice(HOUSING)}. "
+            f"{rng.randint(0, 4)} existing credit lines.",
+        )
+
+
+def generate_user_loans(
+    rng: random.Random,
+    start_id: int,
+    count: int,
+    user_ids: tuple[int, int],
+    loans: list[tuple[int, str]],
+) -> Iterator[tuple]:
+    """Yield application rows in `user_loans` column order.
+
+    Users are drawn with a skewed distribution so that low user ids have
+    many more applications than the rest, like a few heavy borrowers.
+    """
+    first_user, last_user = user_ids
+    span = last_user - first_user + 1
+    base_date = datetime.now() - timedelta(days=5 * 365)
+    for application_id in range(start_id, start_id + count):
+        user_id = first_user + int(span * rng.random() ** 2)
+        loan_id, loan_type = rng.choice(loans)
+        applied_on = base_date + timedelta(
+            days=rng.randint(0, 5 * 365), seconds=rng.randint(0, 86399)
+        )
+        ended = rng.random() < 0.3
+        template = rng.choice(RECORD_ENDED if ended else RECORD_APPROVED)
+        yield (
+            application_id,
+            user_id,
+            loan_id,
+            applied_on.isoformat(),
+            ended,
+            template.format(type=loan_type, score=rng.randint(580, 850)),
+        )
+
+
+def _bulk_insert(
+    conn: sqlite3.Connection,
+    sql: str,
+    rows: Iterator[tuple],
+    total: int,
+    batch_size: int,
+    label: str,
+):
+    """Insert `rows` with executemany, committing once per batch."""
+    started = time.perf_counter()
+    inserted = 0
+    batch: list[tuple] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            conn.executemany(sql, batch)
+            conn.commit()
+            inserted += len(batch)
+            batch.clear()
+            print(f"  {label}: {inserted:,}/{total:,}")
+    if batch:
+        conn.executemany(sql, batch)
+        conn.commit()
+        inserted += len(batch)
+    elapsed = time.perf_counter() - started
+    rate = inserted / elapsed if elapsed > 0 else float("inf")
+    print(f"Inserted {inserted:,} {label} in {elapsed:.1f}s ({rate:,.0f} rows/s)")
+
+
+def seed_bulk(
+    db_path: str,
+    n_users: int,
+    n_loans: int,
+    n_applications: int,
+    batch_size: int = 100_000,
+    seed: int = 42,
+) -> sqlite3.Connection:
+    """Append synthetic rows to `db_path`, creating and demo-seeding it if new.
+
+    New ids continue after the current maximum so the demo rows stay intact.
+    """
+    db_exist = os.path.exists(db_path)
+    if not db_exist and os.path.dirname(db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = create_database(db_path)
+    cursor = conn.cursor()
+    if not db_exist:
+        seed_loans(cursor)
+        seed_users(cursor)
+        seed_user_loans(cursor)
+        conn.commit()
+
+    for pragma in BULK_LOAD_PRAGMAS:
+        cursor.execute(pragma)
+
+    rng = random.Random(seed)
+
+    first_loan = _next_id(cursor, "loans", "loan_id")
+    print(f"Generating {n_loans:,} loans from id {first_loan}")
+    _bulk_insert(
+        conn,
+        "INSERT INTO loans VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        generate_loans(rng, first_loan, n_loans),
+        n_loans,
+        batch_size,
+        "loans",
+    )
+
+    first_user = _next_id(cursor, "users", "user_id")
+    print(f"Generating {n_users:,} users from id {first_user}")
+    _bulk_insert(
+        conn,
+        "INSERT INTO users VALUES (?, ?, ?, ?, ?, ?)",
+        generate_users(rng, first_user, n_users),
+        n_users,
+        batch_size,
+        "users",
+    )
+
+    if n_applications:
+        cursor.execute("SELECT loan_id, type FROM loans")
+        loans = cursor.fetchall()
+        cursor.execute("SELECT MIN(user_id), MAX(user_id) FROM users")
+        user_ids = cursor.fetchone()
+        if not loans or user_ids[0] is None:
+            print("No users or loans available; skipping applications.")
+        else:
+            first_application = _next_id(cursor, "user_loans", "application_id")
+            print(
+                f"Generating {n_applications:,} applications "
+                f"from id {first_application}"
+            )
+            _bulk_insert(
+                conn,
+                "INSERT INTO user_loans VALUES (?, ?, ?, ?, ?, ?)",
+                generate_user_loans(
+                    rng, first_application, n_applications, user_ids, loans
+                ),
+                n_applications,
+                batch_size,
+                "applications",
+            )
+
+    # Refresh planner statistics and restore normal durability settings.
+    cursor.execute("ANALYZE")
+    cursor.execute("PRAGMA locking_mode = NORMAL")
+    cursor.execute("PRAGMA synchronous = FULL")
+    conn.commit()
+    cursor.execute("PRAGMA journal_mode = WAL")
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk-generate synthetic data for the loans database."
+    )
+    parser.add_argument("db_path", help="SQLite file to create or extend")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--loans", type=int, default=5_000)
+    parser.add_argument("--applications", type=int, default=3_000_000)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100_000,
+        help="Rows per executemany/commit",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    conn = seed_bulk(
+        args.db_path,
+        n_users=args.users,
+        n_loans=args.loans,
+        n_applications=args.applications,
+        batch_size=args.batch_size,
+        seed=args.seed,
+    )
+    conn.close()
+    print(f"Done in {time.perf_counter() - started:.1f}s -> {args.db_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Pool of per-user agent sessions.
+
+Each user gets their own `ReActAgent`, so switching users no longer wipes
+anyone's conversation and concurrent requests never share a mutable
+`user`. Agents are created by a factory that puts them on the shared
+`AgentRuntime`; conversation state itself lives in the checkpointer, so an
+evicted session is rebuilt with its history intact on the next request.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import metrics
+from agent import ReActAgent
+from model import User
+
+
+@dataclass
+class _Session:
+    agent: ReActAgent
+    last_used: float
+    # held for the duration of a turn so one user's requests run in order
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # callers inside `AgentPool.session`, counted before they take the lock
+    holders: int = 0
+
+    def busy(self) -> bool:
+        return self.holders > 0 or self.lock.locked()
+
+
+class AgentPool:
+    """Thread-safe LRU of agents keyed by user id."""
+
+    def __init__(
+        self,
+        factory: Callable[[User], ReActAgent],
+        max_sessions: int = 256,
+        idle_ttl_s: float | None = 1800,
+    ):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_ttl_s = idle_ttl_s
+        self._sessions: OrderedDict[int, _Session] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_session(self, user: User, hold: bool = False) -> _Session:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(user.user_id)
+            if session is not None:
+                self._sessions.move_to_end(user.user_id)
+                session.last_used = now
+                # pick up profile changes (income, credit score...)
+                session.agent.user = user
+                session.holders += hold
+                metrics.increment("agent_pool.hits")
+                return session
+        # the factory runs outside the pool lock
+        agent = self.factory(user)
+        with self._lock:
+            session = self._sessions.get(user.user_id)
+            if session is None:
+                session = _Session(agent, now)
+                self._sessions[user.user_id] = session
+                metrics.increment("agent_pool.created")
+            session.holders += hold
+            self._evict_overflow(keep=user.user_id)
+            return session
+
+    def get(self, user: User) -> ReActAgent:
+        return self._get_session(user).agent
+
+    @contextmanager
+    def session(self, user: User) -> Iterator[ReActAgent]:
+        """Yield the user's agent, holding its lock for the whole turn."""
+        session = self._get_session(user, hold=True)
+        try:
+            with session.lock:
+                yield session.agent
+                session.last_used = time.monotonic()
+        finally:
+            with self._lock:
+                session.holders -= 1
+
+    def _evict_idle(self, now: float):
+        """Drop sessions idle longer than the TTL; the caller holds the lock."""
+        if self.idle_ttl_s is None:
+            return
+        idle = [
+            user_id
+            for user_id, session in self._sessions.items()
+            if now - session.last_used > self.idle_ttl_s and not session.busy()
+        ]
+        for user_id in idle:
+            del self._sessions[user_id]
+        if idle:
+            metrics.increment("agent_pool.evicted", len(idle))
+
+    def _evict_overflow(self, keep: int):
+        """Drop least recently used sessions above `max_sessions`.
+
+        Busy sessions are skipped, so the pool may stay over size until their
+        turns finish; evicting one would let a second agent for the same user
+        run next to it. `keep` (the session being handed out) is never
+        dropped. The caller holds the lock.
+        """
+        excess = len(self._sessions) - self.max_sessions
+        if excess <= 0:
+            return
+        victims = [
+            user_id
+            for user_id, session in self._sessions.items()
+            if user_id != keep and not session.busy()
+        ][:excess]
+        for user_id in victims:
+            del self._sessions[user_id]
+        if victims:
+            metrics.increment("agent_pool.evicted", len(victims))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
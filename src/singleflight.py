@@ -0,0 +1,192 @@
+"""
+Coalescing of identical concurrent calls ("singleflight").
+
+When several sessions send the same request at the same time, only the first
+caller (the leader) runs it; the others wait and receive the leader's result.
+Nothing is cached: once the call finishes, the next identical request runs
+again. Used by the chat model in `llm.py` and the embeddings in `rag.py`.
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import threading
+from collections.abc import Awaitable, Callable, Iterator
+from typing import Any, TypeVar
+
+from langchain_core.messages import BaseMessage
+
+import metrics
+
+T = TypeVar("T")
+
+
+def payload_key(*parts: Any) -> str:
+    """Stable key for a request payload (canonical JSON, hashed)."""
+    text = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def message_payload(message: BaseMessage) -> dict:
+    """The parts of a message that reach the model; ids are left out."""
+    content = message.content
+    payload = {
+        "type": message.type,
+        "content": content.strip() if isinstance(content, str) else content,
+    }
+    for attr in ("name", "tool_call_id", "tool_calls"):
+        value = getattr(message, attr, None)
+        if value:
+            payload[attr] = value
+    return payload
+
+
+# Result a cancelled async leader leaves for its waiters: run the call again.
+_RETRY = object()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class _StreamCall:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.items: list = []
+        self.finished = False
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its result.
+
+    Results are deep-copied for each waiter when `copy_results` is set, since
+    LangChain fills in ids and metadata on the objects it gets back.
+    """
+
+    def __init__(self, name: str, copy_results: bool = True):
+        self.name = name
+        self.copy_results = copy_results
+        self._calls: dict[str, _Call] = {}
+        self._streams: dict[str, _StreamCall] = {}
+        self._futures: dict[tuple[int, str], asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def _share(self, value):
+        return copy.deepcopy(value) if self.copy_results else value
+
+    def _record(self, leader: bool):
+        kind = "calls" if leader else "coalesced"
+        metrics.increment(f"singleflight.{kind}.{self.name}")
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        self._record(leader)
+        if not leader:
+            call.done.wait()  # type: ignore[union-attr]
+            if call.error is not None:  # type: ignore[union-attr]
+                raise call.error  # type: ignore[union-attr]
+            return self._share(call.result)  # type: ignore[union-attr]
+        try:
+            result = fn()
+            call.result = self._share(result)  # type: ignore[union-attr]
+            return result
+        except BaseException as e:
+            call.error = e  # type: ignore[union-attr]
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()  # type: ignore[union-attr]
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        # futures belong to one event loop, so calls only coalesce within it
+        loop = asyncio.get_running_loop()
+        flight = (id(loop), key)
+        while True:
+            with self._lock:
+                future = self._futures.get(flight)
+                leader = future is None
+                if leader:
+                    future = self._futures[flight] = loop.create_future()
+            self._record(leader)
+            if leader:
+                break
+            result = await asyncio.shield(future)  # type: ignore[arg-type]
+            if result is not _RETRY:
+                return self._share(result)
+            # the leader was cancelled; the first waiter to get here leads
+        try:
+            result = await fn()
+            future.set_result(self._share(result))  # type: ignore[union-attr]
+            return result
+        except asyncio.CancelledError:
+            # only the leader's caller gave up; the waiters still want a result
+            future.set_result(_RETRY)  # type: ignore[union-attr]
+            raise
+        except BaseException as e:
+            future.set_exception(e)  # type: ignore[union-attr]
+            # mark it retrieved in case nobody was waiting
+            future.exception()  # type: ignore[union-attr]
+            raise
+        finally:
+            with self._lock:
+                del self._futures[flight]
+
+    def stream(self, key: str, fn: Callable[[], Iterator[T]]) -> Iterator[T]:
+        """`do` for generators: waiters replay the leader's items as they arrive."""
+        with self._lock:
+            call = self._streams.get(key)
+            leader = call is None
+            if leader:
+                call = self._streams[key] = _StreamCall()
+        self._record(leader)
+        if leader:
+            yield from self._lead_stream(key, call, fn)  # type: ignore[arg-type]
+        else:
+            yield from self._follow_stream(call)  # type: ignore[arg-type]
+
+    def _lead_stream(self, key: str, call: _StreamCall, fn: Callable[[], Iterator]):
+        error: BaseException | None = None
+        try:
+            for item in fn():
+                with call.cond:
+                    call.items.append(self._share(item))
+                    call.cond.notify_all()
+                yield item
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            with self._lock:
+                del self._streams[key]
+            with call.cond:
+                if isinstance(error, GeneratorExit):
+                    error = RuntimeError("coalesced stream was abandoned")
+                call.error = error
+                call.finished = True
+                call.cond.notify_all()
+
+    def _follow_stream(self, call: _StreamCall) -> Iterator:
+        seen = 0
+        while True:
+            with call.cond:
+                while seen == len(call.items) and not call.finished:
+                    call.cond.wait()
+                items = call.items[seen:]
+                finished, error = call.finished, call.error
+            seen += len(items)
+            for item in items:
+                yield self._share(item)
+            if finished:
+                if error is not None:
+                    raise error
+                return
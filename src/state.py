@@ -1,12 +1,15 @@
 from dataclasses import dataclass, field
-from typing import Any, List, Optional, cast, Literal, TypedDict
+from typing import Any, Dict, List, Optional, cast, Literal, TypedDict
 import streamlit as st
 
 from model import User, UserLoanWithDetails
-from agent import ReActAgent
+from agent import AgentRuntime
+from sessions import AgentPool
 from ibm_watsonx_ai import APIClient
 from langchain_ibm import ChatWatsonx
 from sqlite3 import Connection as SQLiteConnection
+from db import ReadOnlyDB
+from checkpointer import SQLiteCheckpointer
 from rag import RAG
 from langchain.tools import BaseTool
 
@@ -67,21 +70,43 @@ def get_welcome_message() -> ChatMessage:
 # - **Vision + RAG:** I use vision OCR for scanned pages and retrieval-augmented generation to provide contextual answers
 
 
+@dataclass
+class SharedResources:
+    """Process-wide resources shared by every browser session.
+
+    Built once by `app.get_shared_resources`; `AppState` only references them.
+    """
+
+    llm: ChatWatsonx
+    client: APIClient
+    db_conn: SQLiteConnection
+    read_db: ReadOnlyDB
+    checkpointer: SQLiteCheckpointer
+    rag: RAG
+    tools: List[BaseTool]
+    runtime: AgentRuntime
+    agents: AgentPool
+
+
 @dataclass
 class AppState:
     resources_initialized: bool = False
     llm: Optional[ChatWatsonx] = None
     client: Optional[APIClient] = None
     db_conn: Optional[SQLiteConnection] = None
+    read_db: Optional[ReadOnlyDB] = None
+    checkpointer: Optional[SQLiteCheckpointer] = None
     rag: Optional[RAG] = None
     tools: List[BaseTool] = field(default_factory=list)
     users: List[User] = field(default_factory=list)
-    agent: Optional[ReActAgent] = None
+    agents: Optional[AgentPool] = None
     current_user_id: Optional[int] = None
     applied_loans: List[UserLoanWithDetails] = field(default_factory=list)
     chat_history: List[ChatMessage] = field(
         default_factory=lambda: [get_welcome_message()]
     )
+    # chat history of the other users, restored when switching back
+    chat_histories: Dict[int, List[ChatMessage]] = field(default_factory=dict)
 
 
 def get_app_state() -> AppState:
@@ -0,0 +1,124 @@
+"""
+Incremental extraction of a JSON string field from streamed LLM output.
+
+The agents answer with JSON such as `{"response": "...", "loan_id_to_apply":
+null}`. To show the reply while it is being generated, `JsonFieldStreamer`
+is fed the raw chunks and returns the decoded characters of one top-level
+string field as soon as they arrive, without waiting for the closing brace.
+"""
+
+_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class JsonFieldStreamer:
+    """Stream the value of top-level string `field` out of partial JSON.
+
+    Output that does not start with `{` is passed through unchanged, matching
+    the agents' fallback of showing unparseable output as-is.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.text = ""  # everything returned by `feed` so far
+        self._mode: str | None = None  # "json" or "plain" after the first char
+        self._depth = 0
+        self._in_string = False
+        self._is_key = False
+        self._expect_key = False
+        self._key: list[str] = []
+        self._last_key: str | None = None
+        self._capture = False
+        self._done = False
+        # None, "\\" right after a backslash, or "u" plus the hex digits so far
+        self._escape: str | None = None
+        self._high_surrogate: int | None = None
+
+    def feed(self, chunk: str) -> str:
+        out: list[str] = []
+        for ch in chunk:
+            if self._mode is None:
+                if ch.isspace():
+                    continue
+                self._mode = "json" if ch == "{" else "plain"
+            if self._mode == "plain":
+                out.append(ch)
+            elif self._in_string:
+                self._string_char(ch, out)
+            elif ch == '"':
+                self._in_string = True
+                self._is_key = self._depth == 1 and self._expect_key
+                self._capture = (
+                    self._depth == 1
+                    and not self._is_key
+                    and not self._done
+                    and self._last_key == self.field
+                )
+                self._key = []
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = ch == "{"
+            elif ch in "}]":
+                self._depth -= 1
+            elif self._depth == 1 and ch == ",":
+                self._expect_key = True
+                self._last_key = None
+            elif self._depth == 1 and ch == ":":
+                self._expect_key = False
+        text = "".join(out)
+        self.text += text
+        return text
+
+    def _string_char(self, ch: str, out: list[str]):
+        if self._escape == "\\":
+            if ch == "u":
+                self._escape = "u"
+            else:
+                self._escape = None
+                self._emit(_ESCAPES.get(ch, ch), out)
+            return
+        if self._escape is not None:
+            self._escape += ch
+            if len(self._escape) == 5:
+                self._emit_code_point(self._escape[1:], out)
+                self._escape = None
+            return
+        if ch == "\\":
+            self._escape = "\\"
+        elif ch == '"':
+            self._in_string = False
+            if self._is_key:
+                self._last_key = "".join(self._key)
+            if self._capture:
+                self._capture = False
+                self._done = True
+        else:
+            self._emit(ch, out)
+
+    def _emit_code_point(self, digits: str, out: list[str]):
+        try:
+            code = int(digits, 16)
+        except ValueError:
+            code = 0xFFFD
+        if 0xD800 <= code < 0xDC00:
+            self._high_surrogate = code
+            return
+        if 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self._high_surrogate = None
+        self._emit(chr(code), out)
+
+    def _emit(self, text: str, out: list[str]):
+        if self._is_key:
+            self._key.append(text)
+        elif self._capture:
+            out.append(text)
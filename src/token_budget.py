@@ -0,0 +1,154 @@
+"""
+Input-token budget for the base advisor prompt.
+
+The checkpointed history grows with every turn, tool outputs included, so
+`TokenBudget.fit` trims it before each LLM call:
+
+- the system messages and the turn in progress (whose tool calls and
+  results must stay paired) are always kept; the other `keep_last_turns - 1`
+  recent turns are kept whole only while they fit;
+- older turns lose their tool-call chatter, keeping only the user's message
+  and the final answer;
+- whole older turns are then dropped, oldest first, until the prompt fits
+  `max_input_tokens`.
+
+Per-message token counts are cached, so each message is counted once even
+though the same history is re-sent on every call.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+import metrics
+
+DEFAULT_MAX_INPUT_TOKENS = 8000
+DEFAULT_KEEP_LAST_TURNS = 3
+
+
+class TokenCounter:
+    """Approximate token counts, cached per message."""
+
+    def __init__(self, max_entries: int = 8192):
+        self.max_entries = max_entries
+        self._counts: OrderedDict[tuple, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(message: AnyMessage) -> tuple:
+        content = str(message.content)
+        if message.id:
+            return (message.id, len(content))
+        # messages rebuilt for every call (e.g. the system prompt) have no id
+        digest = hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+        return (message.type, digest)
+
+    def count(self, message: AnyMessage) -> int:
+        key = self.key(message)
+        with self._lock:
+            if key in self._counts:
+                self._counts.move_to_end(key)
+                return self._counts[key]
+        tokens = count_tokens_approximately([message])
+        with self._lock:
+            self._counts[key] = tokens
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return tokens
+
+
+@dataclass
+class BudgetReport:
+    tokens_before: int
+    tokens_after: int
+    messages_dropped: int
+    over_budget: bool
+
+
+def split_turns(history: list[AnyMessage]) -> list[list[AnyMessage]]:
+    """Group messages into turns, each starting at a human message."""
+    turns: list[list[AnyMessage]] = []
+    for message in history:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _without_tool_chatter(turn: list[AnyMessage]) -> list[AnyMessage]:
+    return [
+        m
+        for m in turn
+        if not isinstance(m, ToolMessage)
+        and not (isinstance(m, AIMessage) and m.tool_calls)
+    ]
+
+
+class TokenBudget:
+    def __init__(
+        self,
+        max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS,
+        keep_last_turns: int = DEFAULT_KEEP_LAST_TURNS,
+        drop_old_tool_messages: bool = True,
+        counter: TokenCounter | None = None,
+    ):
+        self.max_input_tokens = max_input_tokens
+        self.keep_last_turns = max(1, keep_last_turns)
+        self.drop_old_tool_messages = drop_old_tool_messages
+        self.counter = counter or TokenCounter()
+
+    def tokens(self, messages: list[AnyMessage]) -> int:
+        return sum(self.counter.count(m) for m in messages)
+
+    def fit(
+        self, prompt: list[AnyMessage], name: str = "prompt"
+    ) -> tuple[list[AnyMessage], BudgetReport]:
+        """Trim the history in `prompt` to the budget.
+
+        The leading system messages and the turn in progress are never
+        dropped, so the result can still exceed the ceiling;
+        `BudgetReport.over_budget` says so.
+        """
+        split = 0
+        while split < len(prompt) and prompt[split].type == "system":
+            split += 1
+        system, turns = prompt[:split], split_turns(prompt[split:])
+        before = self.tokens(prompt)
+
+        pinned = turns[-self.keep_last_turns :]
+        older = turns[: -self.keep_last_turns]
+        available = self.max_input_tokens - self.tokens(system)
+        available -= sum(self.tokens(turn) for turn in pinned)
+        # recent turns that do not fit are trimmed like older ones; the turn
+        # in progress always stays whole
+        while available < 0 and len(pinned) > 1:
+            turn = pinned.pop(0)
+            available += self.tokens(turn)
+            older.append(turn)
+        if self.drop_old_tool_messages:
+            older = [_without_tool_chatter(turn) for turn in older]
+        kept: list[list[AnyMessage]] = []
+        for turn in reversed(older):
+            cost = self.tokens(turn)
+            if cost > available:
+                break
+            kept.insert(0, turn)
+            available -= cost
+
+        trimmed = system + [m for turn in kept + pinned for m in turn]
+        after = self.tokens(trimmed)
+        report = BudgetReport(
+            tokens_before=before,
+            tokens_after=after,
+            messages_dropped=len(prompt) - len(trimmed),
+            over_budget=after > self.max_input_tokens,
+        )
+        metrics.histogram(f"prompt_tokens.{name}", metrics.TOKEN_BUCKETS).observe(after)
+        metrics.increment(f"prompt_tokens_trimmed.{name}", before - after)
+        if report.over_budget:
+            metrics.increment(f"prompt_over_budget.{name}")
+        return trimmed, report
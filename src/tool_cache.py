@@ -0,0 +1,245 @@
+"""
+Result cache for agent tools.
+
+Tools opt in with the `cached` decorator placed above `@tool`, declaring
+whether they are pure (output depends only on the arguments) or impure (they
+read state that can change), a TTL, and the events that invalidate them.
+Writers publish those events with `invalidate`, e.g. `dal.add_user_loan_record`
+invalidates cached `get_user_loans` results for that user only. Other caches
+can `subscribe` to the same events.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from langchain_core.tools import BaseTool, StructuredTool
+
+import metrics
+
+# Events published by writers.
+USER_LOANS_CHANGED = "user_loans"
+LOAN_CATALOG_CHANGED = "loan_catalog"
+KNOWLEDGE_CHANGED = "knowledge"
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    pure: bool = False
+    # seconds until an entry expires; None keeps it until evicted (pure only)
+    ttl_s: float | None = None
+    invalidated_by: frozenset[str] = field(default_factory=frozenset)
+    # name of the argument holding the user id, for per-user invalidation
+    user_arg: str | None = None
+    # results failing this check (e.g. transient error messages) are not stored
+    cache_if: Callable[[Any], bool] | None = None
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float | None
+    user: str | None
+    invalidated_by: frozenset[str]
+
+
+def _normalize(value):
+    """Make equivalent arguments compare equal (1 vs 1.0, extra whitespace)."""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return str(value)
+
+
+class ToolCache:
+    """Bounded LRU of tool results keyed by (tool name, normalized args, user)."""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._hits: dict[str, int] = {}
+        self._misses: dict[str, int] = {}
+        # bumped by every invalidation so results computed concurrently with
+        # a write are not stored afterwards
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _lookup(self, name: str, policy: CachePolicy, args: dict):
+        """Return (hit, value, key, user, generation) for a call."""
+        user = None
+        if policy.user_arg is not None and policy.user_arg in args:
+            user = str(args[policy.user_arg])
+        key = (name, json.dumps(_normalize(args), sort_keys=True), user)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at is None or entry.expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits[name] = self._hits.get(name, 0) + 1
+                    metrics.increment(f"tool_cache.hits.{name}")
+                    return True, entry.value, key, user, self._generation
+                del self._entries[key]
+            self._misses[name] = self._misses.get(name, 0) + 1
+            generation = self._generation
+        metrics.increment(f"tool_cache.misses.{name}")
+        return False, None, key, user, generation
+
+    def _store(self, policy: CachePolicy, key, user, generation: int, value):
+        if policy.cache_if is not None and not policy.cache_if(value):
+            return
+        expires_at = None
+        if policy.ttl_s is not None:
+            expires_at = time.monotonic() + policy.ttl_s
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = _Entry(
+                    value, expires_at, user, policy.invalidated_by
+                )
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+    def get_or_call(
+        self,
+        name: str,
+        policy: CachePolicy,
+        args: dict,
+        call: Callable[[], Any],
+    ):
+        hit, value, key, user, generation = self._lookup(name, policy, args)
+        if hit:
+            return value
+        value = call()
+        self._store(policy, key, user, generation, value)
+        return value
+
+    async def aget_or_call(
+        self,
+        name: str,
+        policy: CachePolicy,
+        args: dict,
+        call: Callable[[], Awaitable[Any]],
+    ):
+        hit, value, key, user, generation = self._lookup(name, policy, args)
+        if hit:
+            return value
+        value = await call()
+        self._store(policy, key, user, generation, value)
+        return value
+
+    def invalidate(self, event: str, user: Any = None) -> int:
+        """Drop entries invalidated by `event`, only for `user` if given."""
+        user = None if user is None else str(user)
+        with self._lock:
+            self._generation += 1
+            stale = [
+                key
+                for key, entry in self._entries.items()
+                if event in entry.invalidated_by
+                and (user is None or entry.user is None or entry.user == user)
+            ]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            print(f"Tool cache: '{event}' invalidated {len(stale)} entries")
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict[str, dict]:
+        """Per-tool hits, misses and hit rate."""
+        with self._lock:
+            names = set(self._hits) | set(self._misses)
+            stats = {}
+            for name in sorted(names):
+                hits = self._hits.get(name, 0)
+                misses = self._misses.get(name, 0)
+                stats[name] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": hits / (hits + misses),
+                    "entries": sum(1 for key in self._entries if key[0] == name),
+                }
+            return stats
+
+
+TOOL_CACHE = ToolCache()
+
+# other caches derived from the same state, by event
+_subscribers: dict[str, list[Callable[[], None]]] = {}
+
+
+def subscribe(event: str, callback: Callable[[], None]):
+    """Call `callback` whenever `event` is published, e.g. to clear a cache."""
+    _subscribers.setdefault(event, []).append(callback)
+
+
+def invalidate(event: str, user: Any = None) -> int:
+    dropped = TOOL_CACHE.invalidate(event, user)
+    for callback in _subscribers.get(event, []):
+        callback()
+    return dropped
+
+
+def cached(
+    pure: bool = False,
+    ttl_s: float | None = None,
+    invalidated_by: set[str] | frozenset[str] = frozenset(),
+    user_arg: str | None = None,
+    cache_if: Callable[[Any], bool] | None = None,
+    cache: ToolCache | None = None,
+) -> Callable[[BaseTool], BaseTool]:
+    """Wrap a `@tool` so identical calls are served from the cache.
+
+    Impure tools must declare a TTL, since nothing else guarantees that the
+    state they read is reflected eventually.
+    """
+    if not pure and ttl_s is None:
+        raise ValueError("impure tools must declare a ttl_s")
+    policy = CachePolicy(
+        pure=pure,
+        ttl_s=ttl_s,
+        invalidated_by=frozenset(invalidated_by),
+        user_arg=user_arg,
+        cache_if=cache_if,
+    )
+
+    def decorator(tool: BaseTool) -> BaseTool:
+        func = tool.func  # type: ignore[attr-defined]
+        coroutine = getattr(tool, "coroutine", None)
+
+        def call(**kwargs):
+            return (cache or TOOL_CACHE).get_or_call(
+                tool.name, policy, kwargs, lambda: func(**kwargs)
+            )
+
+        async def acall(**kwargs):
+            return await (cache or TOOL_CACHE).aget_or_call(
+                tool.name, policy, kwargs, lambda: coroutine(**kwargs)
+            )
+
+        return StructuredTool.from_function(
+            func=call,
+            # without a native coroutine, `ainvoke` runs `call` in an executor
+            coroutine=acall if coroutine is not None else None,
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            metadata={**(tool.metadata or {}), "cache_policy": policy},
+        )
+
+    return decorator
@@ -0,0 +1,135 @@
+"""
+Side store for full tool outputs that were compacted out of graph state.
+
+Once a turn has consumed a tool result, `AgentRuntime.compact_history` replaces
+large `ToolMessage`s with a short digest and a reference key, and stores the
+full payload here. The agent can get it back with the `fetch_tool_output`
+tool, so later turns neither re-send nor checkpoint thousands of characters
+of RAG text or loan catalogs.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import BaseTool, StructuredTool
+
+import metrics
+
+# Tool messages shorter than this are left in state as they are.
+COMPACT_MIN_CHARS = 600
+DIGEST_CHARS = 240
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tool_outputs (
+    ref TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    tool TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tool_outputs_thread ON tool_outputs (thread_id);
+CREATE INDEX IF NOT EXISTS idx_tool_outputs_created ON tool_outputs (created_at);
+"""
+
+
+def digest(content: str, max_chars: int = DIGEST_CHARS) -> str:
+    text = " ".join(content.split())
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + " ..."
+
+
+def is_compacted(message: ToolMessage) -> bool:
+    return "tool_output_ref" in message.additional_kwargs
+
+
+class ToolOutputStore:
+    """Full tool outputs by reference key, bounded by count and age."""
+
+    def __init__(
+        self,
+        db_path: str = ":memory:",
+        max_entries: int = 50_000,
+        ttl_s: float | None = 7 * 24 * 3600,
+    ):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        if db_path != ":memory:" and os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self.conn:
+            self.conn.executescript(SCHEMA)
+
+    @staticmethod
+    def ref(thread_id: str, content: str) -> str:
+        h = hashlib.sha256(f"{thread_id}\0{content}".encode("utf-8"))
+        return f"out_{h.hexdigest()[:16]}"
+
+    def put(self, thread_id: str, tool: str, content: str) -> str:
+        ref = self.ref(thread_id, content)
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO tool_outputs VALUES (?, ?, ?, ?, ?)",
+                (ref, thread_id, tool, content, now),
+            )
+            if self.ttl_s is not None:
+                self.conn.execute(
+                    "DELETE FROM tool_outputs WHERE created_at < ?",
+                    (now - self.ttl_s,),
+                )
+            self.conn.execute(
+                "DELETE FROM tool_outputs WHERE ref IN (SELECT ref FROM tool_outputs"
+                " ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        return ref
+
+    def get(self, ref: str) -> str | None:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT content FROM tool_outputs WHERE ref = ?", (ref,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def delete_thread(self, thread_id: str):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM tool_outputs WHERE thread_id = ?", (thread_id,)
+            )
+
+    def compact(self, thread_id: str, message: ToolMessage) -> ToolMessage | None:
+        """Return a digest replacement for `message`, or None to keep it."""
+        content = str(message.content)
+        if is_compacted(message) or len(content) < COMPACT_MIN_CHARS:
+            return None
+        ref = self.put(thread_id, message.name or "tool", content)
+        metrics.increment("tool_outputs.compacted")
+        metrics.increment("tool_outputs.chars_saved", len(content))
+        return ToolMessage(
+            id=message.id,  # same id, so add_messages replaces it in state
+            tool_call_id=message.tool_call_id,
+            name=message.name,
+            content=(
+                f"[Compacted output of {message.name}, {len(content)} characters."
+                f' Call fetch_tool_output with ref="{ref}" for the full text.]'
+                f"\nDigest: {digest(content)}"
+            ),
+            additional_kwargs={"tool_output_ref": ref},
+        )
+
+    def as_tool(self) -> BaseTool:
+        def fetch_tool_output(ref: str) -> str:
+            content = self.get(ref)
+            return content if content is not None else f"No stored output for {ref}."
+
+        return StructuredTool.from_function(
+            func=fetch_tool_output,
+            name="fetch_tool_output",
+            description="Use this tool to re-fetch the full text of an earlier tool result that was compacted to a digest, by its ref.",
+        )
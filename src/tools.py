@@ -1,82 +1,239 @@
 from rag import RAG
 from sqlite3 import Connection as SQLiteConnection
+from db import ReadOnlyDB
 from langchain.tools import BaseTool, tool
+from langchain_core.tools import StructuredTool
+import calculator
 import dal
+import finance
+import math
 import model
+import numpy as np
+from tool_cache import (
+    cached,
+    KNOWLEDGE_CHANGED,
+    LOAN_CATALOG_CHANGED,
+    USER_LOANS_CHANGED,
+)
+
+# How long impure tool results may be served from the cache. Writes through
+# the DAL and RAG also invalidate them immediately (see tool_cache).
+DB_CACHE_TTL_S = 300.0
+KNOWLEDGE_CACHE_TTL_S = 3600.0
+
+# Maximum number of schedule rows returned by the amortization tool.
+MAX_SCHEDULE_ROWS = 40
+CALCULATOR_FUNCTIONS = ", ".join(calculator.FUNCTIONS)
 
 
 def calc_apr(
     principal: float, monthly_payment: float, term_months: int, fee: float = 0.0
-):
-    n = term_months
-    P = principal - fee
-    L = monthly_payment
-    # Using Newton-Raphson method to approximate monthly rate
-    v = 0.1  # initial guess
-    epsilon = 1e-6
-    for _ in range(50):
-        prev = v
-        fv = P * (1 + v) ** n - L * ((1 + v) ** n - 1) / v
-        fprime = P * n * (1 + v) ** (n - 1) - (L / (v**2)) * (
-            v * n * (1 + v) ** (n - 1) - ((1 + v) ** n - 1)
+) -> float:
+    """APR in percent for a single loan; NaN when the inputs have no solution."""
+    return float(finance.solve_apr(principal, monthly_payment, term_months, fee))
+
+
+COMPARISON_SORT_KEYS = ("total_cost", "monthly_payment", "apr")
+
+
+def compare_loans(
+    loans: list[model.Loan],
+    terms: list[int] | None = None,
+    amounts: list[float] | None = None,
+    rate_adjustments: list[float] | None = None,
+    sort_by: str = "total_cost",
+    top_n: int = 10,
+) -> tuple[list[dict], int]:
+    """Price every (loan x term x amount x rate adjustment) scenario at once.
+
+    Omitted terms/amounts default to each loan's own. Rate adjustments are
+    percentage points added to the loan's rate. Fees scale with the amount
+    (fee / amount of the product). Returns the `top_n` cheapest scenarios by
+    `sort_by` and the number of scenarios evaluated.
+    """
+
+    # Axes: loan, term, amount, rate adjustment.
+    def column(attr: str) -> np.ndarray:
+        return np.array([getattr(loan, attr) for loan in loans], dtype=float)[
+            :, None, None, None
+        ]
+
+    base_amount = column("amount")
+    term = column("term_months")
+    if terms:
+        term = np.array(terms, dtype=float)[None, :, None, None]
+    amount = base_amount
+    if amounts:
+        amount = np.array(amounts, dtype=float)[None, None, :, None]
+    adjustment = np.array(rate_adjustments or [0.0], dtype=float)[None, None, None, :]
+
+    rate = np.maximum(column("interest_rate") + adjustment, 0.0)
+    loan_index, term, amount, rate = np.broadcast_arrays(
+        np.arange(len(loans))[:, None, None, None], term, amount, rate
+    )
+    fee = (column("fee") / base_amount) * amount
+    payment = finance.monthly_payment(amount, rate, term)
+    apr = finance.solve_apr(amount, payment, term, fee)
+    total_paid = payment * term + fee
+    sort_values = {
+        "total_cost": total_paid - amount,
+        "monthly_payment": payment,
+        "apr": apr,
+    }
+
+    key = np.nan_to_num(sort_values[sort_by].ravel(), nan=np.inf)
+    order = np.argsort(key, kind="stable")[:top_n]
+    rows = []
+    for i in order:
+        loan = loans[loan_index.flat[i]]
+        rows.append(
+            {
+                "loan_id": loan.loan_id,
+                "type": loan.type,
+                "required_credit_score": loan.required_credit_score,
+                "amount": float(amount.flat[i]),
+                "term_months": int(term.flat[i]),
+                "interest_rate": float(rate.flat[i]),
+                "monthly_payment": float(payment.flat[i]),
+                "apr": float(apr.flat[i]),
+                "total_paid": float(total_paid.flat[i]),
+                "total_cost": float(sort_values["total_cost"].flat[i]),
+            }
+        )
+    return rows, key.size
+
+
+def format_schedule(
+    schedule: dict, baseline: dict | None = None, show_months: list[int] | None = None
+) -> str:
+    """Compact text summary of an amortization schedule for the LLM."""
+    totals = finance.schedule_totals(schedule)
+    months = schedule["month"]
+    lines = [
+        f"Initial monthly payment: {schedule['payment'][0]:.2f}",
+        f"Payoff month: {totals['payoff_month']}",
+        f"Total paid: {totals['total_paid']:.2f}",
+        f"Total interest: {totals['total_interest']:.2f}",
+    ]
+    if baseline is not None:
+        base_totals = finance.schedule_totals(baseline)
+        lines.append(
+            f"Interest saved vs. no extra payments: {base_totals['total_interest'] - totals['total_interest']:.2f}"
+        )
+        lines.append(
+            f"Months saved vs. no extra payments: {base_totals['payoff_month'] - totals['payoff_month']}"
+        )
+
+    if show_months:
+        wanted = set(show_months)
+    else:
+        # First three months, each year end, months where the payment changes
+        # and the final month.
+        wanted = {1, 2, 3, int(months[-1])}
+        wanted.update(m for m in range(12, int(months[-1]) + 1, 12))
+        changed = np.flatnonzero(np.abs(np.diff(schedule["payment"])) > 0.005) + 1
+        wanted.update(int(months[i]) for i in changed)
+    index = np.flatnonzero(np.isin(months, sorted(wanted)))[:MAX_SCHEDULE_ROWS]
+
+    lines.append("Month | Rate % | Payment | Interest | Principal | Balance")
+    for i in index:
+        lines.append(
+            f"{months[i]} | {schedule['rate'][i]:.3f} | {schedule['payment'][i]:.2f} | "
+            f"{schedule['interest'][i]:.2f} | {schedule['principal'][i]:.2f} | "
+            f"{schedule['balance'][i]:.2f}"
+        )
+    return "\n".join(lines)
+
+
+def _combine_documents(docs) -> str:
+    print(f"Retrieved {len(docs)} documents for query")
+    combined_content = "\n\n".join([doc.page_content for doc in docs])
+    return combined_content if combined_content else "No relevant documents found."
+
+
+def knowledge_tool(name: str, description: str, rag: RAG):
+    """Like `@tool`, but also gives the tool a native coroutine built on
+    `rag.asearch`, so the async graph path awaits the vector store directly."""
+
+    def decorator(func) -> BaseTool:
+        async def coroutine(query: str) -> str:
+            try:
+                docs = await rag.asearch(query, k=3)
+                return _combine_documents(docs)
+            except Exception as e:
+                print(f"Error retrieving documents: {e}")
+                return "No relevant documents found due to an error."
+
+        return StructuredTool.from_function(
+            func=func, coroutine=coroutine, name=name, description=description
         )
-        v = v - fv / fprime
-        if abs(v - prev) < epsilon:
-            break
 
-    APR = (1 + v) ** 12 - 1
-    return APR * 100  # return as percentage
+    return decorator
+
 
+def get_tools(
+    rag: RAG, db_conn: SQLiteConnection, read_db: ReadOnlyDB | None = None
+) -> list[BaseTool]:
+    # All db tools are read-only; route them through the read-only connections
+    # when available so they never contend with application writes.
+    def read_conn() -> SQLiteConnection:
+        return read_db.connection() if read_db is not None else db_conn
 
-def get_tools(rag: RAG, db_conn: SQLiteConnection) -> list[BaseTool]:
     # rag tools
-    @tool(
+    @cached(
+        ttl_s=KNOWLEDGE_CACHE_TTL_S,
+        invalidated_by={KNOWLEDGE_CHANGED},
+        cache_if=lambda result: "due to an error" not in result,
+    )
+    @knowledge_tool(
         "retrieve_loan_knowledge",
         description="Use this tool to retrieve relevant loan documents and information to assist with user queries about loans.",
+        rag=rag,
     )
     def retrieve_loan_knowledge(query: str) -> str:
         try:
             docs = rag.search(query, k=3)
-            print(f"Retrieved {len(docs)} documents for query")
-            combined_content = "\n\n".join([doc.page_content for doc in docs])
-            return (
-                combined_content if combined_content else "No relevant documents found."
-            )
+            return _combine_documents(docs)
         except Exception as e:
             print(f"Error retrieving documents: {e}")
             return "No relevant documents found due to an error."
 
     # db tools
+    @cached(
+        ttl_s=DB_CACHE_TTL_S, invalidated_by={USER_LOANS_CHANGED}, user_arg="user_id"
+    )
     @tool(
         "get_user_loans",
         description="Use this tool to get the existing loans of a user by their user ID.",
     )
     def get_user_loans_tool(user_id: int) -> str:
-        loans = dal.get_user_loans(db_conn, user_id)
+        loans = dal.get_user_loans(read_conn(), user_id)
         return (
             model.user_loan_list_to_context(loans)
             if loans
             else "No loans found for this user."
         )
 
+    @cached(ttl_s=DB_CACHE_TTL_S, invalidated_by={LOAN_CATALOG_CHANGED})
     @tool(
         "get_available_loans",
         description="Use this tool to get the list of available loans.",
     )
     def get_available_loans_tool() -> str:
-        loans = dal.get_available_loans(db_conn)
+        loans = dal.get_available_loans(read_conn())
         return (
             "".join([loan.to_context() for loan in loans])
             if loans
             else "No available loans found."
         )
 
+    @cached(ttl_s=DB_CACHE_TTL_S, invalidated_by={LOAN_CATALOG_CHANGED})
     @tool(
         "get_specific_loan",
         description="Use this tool to get details of a specific loan by its loan ID.",
     )
     def get_specific_loan_tool(loan_id: int) -> str:
-        loan = dal.get_specific_loan(db_conn, loan_id)
+        loan = dal.get_specific_loan(read_conn(), loan_id)
         if loan:
             return loan.to_context()
         else:
@@ -84,6 +241,7 @@ def get_tools(rag: RAG, db_conn: SQLiteConnection) -> list[BaseTool]:
 
     # calculation tools can be added here
 
+    @cached(pure=True)
     @tool(
         "calculate_Annual_Percentage_Rate",
         description="Use this tool to calculate the Annual Percentage Rate (APR) given principal, fee, monthly payment and term in months.",
@@ -92,8 +250,11 @@ def get_tools(rag: RAG, db_conn: SQLiteConnection) -> list[BaseTool]:
         principal: float, monthly_payment: float, term_months: int, fee: float = 0.0
     ) -> str:
         apr = calc_apr(principal, monthly_payment, term_months, fee)
+        if math.isnan(apr):
+            return "Unable to calculate APR: principal minus fee, monthly payment and term must all be positive."
         return str(apr)
 
+    @cached(pure=True)
     @tool(
         "multiple_apr_calculator",
         description="Use this tool to calculate APR for multiple loans.",
@@ -106,38 +267,130 @@ def get_tools(rag: RAG, db_conn: SQLiteConnection) -> list[BaseTool]:
     ) -> str:
         if not fees:
             fees = [0.0] * len(principals)
-        aprs = []
-        for principal, monthly_payment, term_months, fee in zip(
-            principals, monthly_payments, term_months_list, fees
-        ):
-            apr = calc_apr(principal, monthly_payment, term_months, fee)
-            aprs.append(apr)
-        return str(aprs)
+        n = min(
+            len(principals), len(monthly_payments), len(term_months_list), len(fees)
+        )
+        aprs = finance.solve_apr(
+            principals[:n], monthly_payments[:n], term_months_list[:n], fees[:n]
+        )
+        # None marks loans whose inputs have no valid APR.
+        return str([None if math.isnan(apr) else float(apr) for apr in aprs])
+
+    @cached(pure=True)
+    @tool(
+        "amortization_schedule",
+        description=(
+            "Use this tool for month-by-month loan breakdowns (payment, interest, principal, balance), "
+            "total interest, payoff month, and the effect of extra monthly payments, one-off lump sums "
+            "(month -> amount) or rate changes (month -> new annual rate %). "
+            "Returns totals plus selected rows; pass show_months to pick specific months."
+        ),
+    )
+    def amortization_schedule_tool(
+        principal: float,
+        annual_interest_rate: float,
+        term_months: int,
+        extra_monthly_payment: float = 0.0,
+        lump_sum_payments: dict[int, float] | None = None,
+        rate_changes: dict[int, float] | None = None,
+        show_months: list[int] | None = None,
+    ) -> str:
+        if principal <= 0 or term_months <= 0 or annual_interest_rate < 0:
+            return "Error in calculation: principal and term must be positive and the rate non-negative."
+        extras = np.full(term_months, float(extra_monthly_payment))
+        for month, amount in (lump_sum_payments or {}).items():
+            if 1 <= int(month) <= term_months:
+                extras[int(month) - 1] += amount
+        schedule = finance.amortization_schedule(
+            principal, annual_interest_rate, term_months, extras, rate_changes
+        )
+        baseline = None
+        if extras.any():
+            baseline = finance.amortization_schedule(
+                principal, annual_interest_rate, term_months, 0.0, rate_changes
+            )
+        return format_schedule(schedule, baseline, show_months)
 
+    @cached(ttl_s=DB_CACHE_TTL_S, invalidated_by={LOAN_CATALOG_CHANGED})
+    @tool(
+        "compare_loans",
+        description=(
+            "Use this tool to compare loan products across terms, amounts and rate scenarios in ONE call "
+            "(e.g. 'which loan is cheapest for me over 36 vs 60 months'). Evaluates every combination of "
+            "loan_ids (default: all available loans), term_months, amounts (default: each loan's own) and "
+            "rate_adjustments in percentage points (default: [0]), and returns a table ranked by sort_by "
+            "('total_cost' = interest + fees, 'monthly_payment' or 'apr')."
+        ),
+    )
+    def compare_loans_tool(
+        loan_ids: list[int] | None = None,
+        term_months: list[int] | None = None,
+        amounts: list[float] | None = None,
+        rate_adjustments: list[float] | None = None,
+        sort_by: str = "total_cost",
+        top_n: int = 10,
+    ) -> str:
+        if sort_by not in COMPARISON_SORT_KEYS:
+            return f"Invalid sort_by; use one of {', '.join(COMPARISON_SORT_KEYS)}."
+        if any(t <= 0 for t in term_months or []) or any(a <= 0 for a in amounts or []):
+            return "Terms and amounts must be positive."
+        conn = read_conn()
+        if loan_ids:
+            loans = [dal.get_specific_loan(conn, loan_id) for loan_id in loan_ids]
+            loans = [loan for loan in loans if loan is not None]
+        else:
+            loans = dal.get_available_loans(conn)
+        if not loans:
+            return "No matching loans found."
+        rows, evaluated = compare_loans(
+            loans, term_months, amounts, rate_adjustments, sort_by, max(1, top_n)
+        )
+        lines = [
+            f"Evaluated {evaluated} scenarios, ranked by {sort_by} (lowest first):",
+            "Rank | Loan ID | Type | Min Credit | Amount | Term | Rate % | Monthly | APR % | Total Paid | Interest + Fees",
+        ]
+        for rank, row in enumerate(rows, start=1):
+            lines.append(
+                f"{rank} | {row['loan_id']} | {row['type']} | {row['required_credit_score']} | "
+                f"{row['amount']:.2f} | {row['term_months']} | {row['interest_rate']:.2f} | "
+                f"{row['monthly_payment']:.2f} | {row['apr']:.3f} | {row['total_paid']:.2f} | "
+                f"{row['total_cost']:.2f}"
+            )
+        return "\n".join(lines)
+
+    @cached(pure=True)
     @tool(
         "general_calculation_tool",
-        description="Use this tool to perform general  calculations based on provided expression.",
+        description=(
+            "Use this tool to perform general calculations based on provided expression. "
+            f"Supports + - * / // % **, parentheses and the functions {CALCULATOR_FUNCTIONS}. "
+            "Financial helpers use periodic rates (e.g. 0.06/12) and positive loan amounts: "
+            "pmt(rate, nper, pv, fv=0) payment, pv(rate, nper, pmt, fv=0) loan amount, "
+            "fv(rate, nper, pmt, pv=0) remaining balance, rate(nper, pmt, pv) periodic rate."
+        ),
     )
     def general_calculation_tool(expression: str) -> str:
-        # A simple eval-based calculator (ensure safety in real implementations)
         try:
-            return str(eval(expression))
-        except Exception as e:
+            return calculator.format_number(calculator.evaluate(expression))
+        except calculator.CalculationError as e:
             return f"Error in calculation: {e}"
 
+    @cached(pure=True)
     @tool(
         "batch_general_calculation_tool",
-        description="Use this tool to perform batch general calculations based on provided expressions.",
+        description=(
+            "Use this tool to perform batch general calculations based on provided expressions. "
+            "Same syntax and functions as general_calculation_tool."
+        ),
     )
     def batch_general_calculation_tool(expressions: list[str]) -> str:
         results = []
-        for expression in expressions:
-            try:
-                result = eval(expression)
-                results.append(result)
-            except Exception as e:
-                results.append(f"Error in calculation: {e}")
-        return str(results)
+        for result in calculator.evaluate_batch(expressions):
+            if isinstance(result, calculator.CalculationError):
+                results.append(repr(f"Error in calculation: {result}"))
+            else:
+                results.append(calculator.format_number(result))
+        return "[" + ", ".join(results) + "]"
 
     return [
         retrieve_loan_knowledge,
@@ -146,6 +399,8 @@ def get_tools(rag: RAG, db_conn: SQLiteConnection) -> list[BaseTool]:
         get_specific_loan_tool,
         calculate_APR,
         multiple_apr_calculator,
+        amortization_schedule_tool,
+        compare_loans_tool,
         general_calculation_tool,
         batch_general_calculation_tool,
     ]